@@ -29,6 +29,8 @@ __version_info__ = tuple(
 
 import logging
 
+from nasty_utils.asyncio_ import AsyncDecompressingTextIOWrapper
+from nasty_utils.column_cache import COLUMN_CACHE_DIR, Column, ColumnCache
 from nasty_utils.datetime_ import (
     advance_date_by_month,
     date_range,
@@ -44,7 +46,38 @@ from nasty_utils.download import (
     download_file_with_progressbar,
     sha256sum,
 )
-from nasty_utils.io_ import DecompressingTextIOWrapper
+from nasty_utils.grep import GrepProgram, grep_file
+from nasty_utils.io_ import (
+    LINE_COUNT_CACHE_FILE,
+    ZSTD_DICT_FILE_NAME,
+    ChecksumMismatchError,
+    CompressingTextIOWrapper,
+    Compression,
+    DecompressingBinaryReader,
+    DecompressingTextIOWrapper,
+    DecompressorBackend,
+    MemoryMappedLineReader,
+    MultiFileTextReader,
+    ReaderStats,
+    ShardedCompressingWriter,
+    count_lines,
+    detect_compression,
+    find_zstd_dict,
+    train_zstd_dict,
+)
+from nasty_utils.jsonl import (
+    JSON_BACKENDS,
+    JsonlReader,
+    find_json_backend,
+    json_loads_function,
+    lookup_field,
+)
+from nasty_utils.line_index import (
+    IndexedLineReader,
+    LineIndex,
+    ReadCheckpoint,
+    ResumableLineReader,
+)
 from nasty_utils.logging_ import (
     ColoredArgumentsFormatter,
     ColoredBraceStyleAdapter,
@@ -54,6 +87,13 @@ from nasty_utils.logging_ import (
 )
 from nasty_utils.logging_settings import DEFAULT_LOGGING_SETTINGS, LoggingSettings
 from nasty_utils.misc import camel_case_split, get_qualified_name, lookup_qualified_name
+from nasty_utils.parallel import (
+    ConsumerStats,
+    FanOutReader,
+    iter_lines_sharded,
+    map_lines_sharded,
+    parallel_map_lines,
+)
 from nasty_utils.program import (
     Argument,
     ArgumentGroup,
@@ -61,10 +101,17 @@ from nasty_utils.program import (
     Program,
     ProgramConfig,
 )
+from nasty_utils.recompress import RecompressProgram, recompress_file, recompressed_path
+from nasty_utils.seekable_zstd import SeekableZstdWriter, ZstdFrame, read_seek_table
 from nasty_utils.settings import Settings, SettingsConfig
+from nasty_utils.sort import sort_lines
 from nasty_utils.typing_ import checked_cast, safe_issubclass
 
 __all__ = [
+    "AsyncDecompressingTextIOWrapper",
+    "COLUMN_CACHE_DIR",
+    "Column",
+    "ColumnCache",
     "advance_date_by_month",
     "date_range",
     "date_to_datetime",
@@ -76,7 +123,33 @@ __all__ = [
     "FileNotOnServerError",
     "download_file_with_progressbar",
     "sha256sum",
+    "GrepProgram",
+    "grep_file",
+    "ChecksumMismatchError",
+    "CompressingTextIOWrapper",
+    "Compression",
+    "DecompressingBinaryReader",
     "DecompressingTextIOWrapper",
+    "DecompressorBackend",
+    "MemoryMappedLineReader",
+    "MultiFileTextReader",
+    "ReaderStats",
+    "ShardedCompressingWriter",
+    "LINE_COUNT_CACHE_FILE",
+    "ZSTD_DICT_FILE_NAME",
+    "count_lines",
+    "detect_compression",
+    "find_zstd_dict",
+    "train_zstd_dict",
+    "JSON_BACKENDS",
+    "JsonlReader",
+    "find_json_backend",
+    "json_loads_function",
+    "lookup_field",
+    "IndexedLineReader",
+    "LineIndex",
+    "ReadCheckpoint",
+    "ResumableLineReader",
     "ColoredArgumentsFormatter",
     "ColoredBraceStyleAdapter",
     "DynamicFileHandler",
@@ -87,11 +160,23 @@ __all__ = [
     "camel_case_split",
     "get_qualified_name",
     "lookup_qualified_name",
+    "ConsumerStats",
+    "FanOutReader",
+    "iter_lines_sharded",
+    "map_lines_sharded",
+    "parallel_map_lines",
     "Argument",
     "ArgumentGroup",
     "ArgumentInfo",
     "Program",
     "ProgramConfig",
+    "RecompressProgram",
+    "recompress_file",
+    "recompressed_path",
+    "SeekableZstdWriter",
+    "ZstdFrame",
+    "read_seek_table",
+    "sort_lines",
     "Settings",
     "SettingsConfig",
     "checked_cast",
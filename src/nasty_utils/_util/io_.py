@@ -0,0 +1,175 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from bz2 import BZ2File
+from enum import Enum
+from functools import lru_cache
+from gzip import GzipFile
+from io import BufferedReader
+from lzma import LZMAFile
+from pathlib import Path
+from typing import BinaryIO, Optional, cast
+
+from zstandard import (
+    ZstdCompressionDict,
+    ZstdCompressor,
+    ZstdDecompressor,
+    ZstdError,
+    get_frame_parameters,
+)
+
+from nasty_utils.seekable_zstd import SeekableZstdWriter
+
+
+class Compression(Enum):
+    GZIP = ".gz"
+    BZIP2 = ".bz2"
+    XZ = ".xz"
+    ZSTD = ".zst"
+
+    @classmethod
+    def from_suffix(cls, path: Path) -> Optional["Compression"]:
+        try:
+            return cls(path.suffix)
+        except ValueError:
+            return None
+
+    @classmethod
+    def from_magic_bytes(cls, header: bytes) -> Optional["Compression"]:
+        if header.startswith(b"\x1f\x8b"):
+            return cls.GZIP
+        elif header.startswith(b"BZh") and header[3:4].isdigit():
+            return cls.BZIP2
+        elif header.startswith(b"\xfd7zXZ\x00"):
+            return cls.XZ
+        elif header.startswith(b"\x28\xb5\x2f\xfd"):
+            return cls.ZSTD
+        # Zstandard files may also start with a skippable frame, whose magic number
+        # can be any of 0x184D2A50 to 0x184D2A5F (stored in little-endian).
+        elif len(header) >= 4 and header[1:4] == b"\x2a\x4d\x18":
+            if header[0] & 0xF0 == 0x50:
+                return cls.ZSTD
+        return None
+
+
+# File name of the Zstandard dictionary that is used for all files in a directory.
+ZSTD_DICT_FILE_NAME = "zstd.dict"
+
+
+def find_zstd_dict(path: Path, dict_id: int) -> Optional[ZstdCompressionDict]:
+    """Finds the Zstandard dictionary with the given ID for a file.
+
+    Looks for a file named ZSTD_DICT_FILE_NAME in the directory of path and all its
+    parents. Loaded dictionaries are cached.
+    """
+    for directory in path.resolve().parents:
+        dict_path = directory / ZSTD_DICT_FILE_NAME
+        try:
+            mtime_ns = dict_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+        zstd_dict = _load_zstd_dict(dict_path, mtime_ns)
+        if zstd_dict.dict_id() == dict_id:
+            return zstd_dict
+    return None
+
+
+@lru_cache(maxsize=64)
+def _load_zstd_dict(dict_path: Path, _mtime_ns: int) -> ZstdCompressionDict:
+    return ZstdCompressionDict(dict_path.read_bytes())
+
+
+def zstd_dict_for(path: Optional[Path], fp: BinaryIO) -> Optional[ZstdCompressionDict]:
+    """Returns the dictionary the first frame of the Zstandard file fp was made with."""
+    try:
+        dict_id = get_frame_parameters(cast(BufferedReader, fp).peek(18)[:18]).dict_id
+    except ZstdError:  # E.g., starts with a skippable frame.
+        return None
+    if not dict_id:
+        return None
+
+    zstd_dict = find_zstd_dict(path, dict_id) if path is not None else None
+    if zstd_dict is None:
+        raise FileNotFoundError(
+            f"File '{path or fp}' needs Zstandard dictionary {dict_id}, but no "
+            f"matching '{ZSTD_DICT_FILE_NAME}' was found next to it."
+        )
+    return zstd_dict
+
+
+def decompressing_reader(
+    fp: BinaryIO,
+    compression: Optional[Compression],
+    zstd_dict: Optional[ZstdCompressionDict] = None,
+) -> BinaryIO:
+    if compression == Compression.GZIP:
+        return cast(BinaryIO, GzipFile(fileobj=fp))
+    elif compression == Compression.BZIP2:
+        return cast(BinaryIO, BZ2File(fp))
+    elif compression == Compression.XZ:
+        return cast(BinaryIO, LZMAFile(fp))
+    elif compression == Compression.ZSTD:
+        return cast(
+            BinaryIO,
+            ZstdDecompressor(dict_data=zstd_dict).stream_reader(
+                fp, read_across_frames=True
+            ),
+        )
+    return fp
+
+
+def compressing_writer(
+    fp: BinaryIO,
+    compression: Optional[Compression],
+    *,
+    compression_level: Optional[int],
+    threads: int,
+    frame_size: Optional[int],
+    zstd_dict: Optional[ZstdCompressionDict],
+) -> BinaryIO:
+    if compression == Compression.GZIP:
+        return cast(
+            BinaryIO,
+            GzipFile(
+                fileobj=fp,
+                mode="wb",
+                compresslevel=compression_level if compression_level is not None else 9,
+            ),
+        )
+    elif compression == Compression.BZIP2:
+        return cast(
+            BinaryIO,
+            BZ2File(
+                fp,
+                mode="wb",
+                compresslevel=compression_level if compression_level is not None else 9,
+            ),
+        )
+    elif compression == Compression.XZ:
+        return cast(BinaryIO, LZMAFile(fp, mode="wb", preset=compression_level))
+    elif compression == Compression.ZSTD:
+        compressor = ZstdCompressor(
+            level=compression_level if compression_level is not None else 3,
+            dict_data=zstd_dict,
+            threads=threads,
+        )
+        if frame_size is not None:
+            return cast(
+                BinaryIO,
+                SeekableZstdWriter(fp, compressor=compressor, frame_size=frame_size),
+            )
+        return cast(BinaryIO, compressor.stream_writer(fp))
+    return fp
@@ -0,0 +1,33 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from datetime import datetime
+from pathlib import Path
+from sys import argv
+from typing import Mapping
+
+from xdg import XDG_DATA_HOME
+
+
+def dynamic_filename_args() -> Mapping[str, object]:
+    """Placeholders available in the filename of DynamicFileHandler."""
+    now = datetime.now()
+    return {
+        "asctime": now,
+        "msecs": now.microsecond / 1000,
+        "argv0": Path(argv[0]).name,
+        "XDG_DATA_HOME": XDG_DATA_HOME,
+    }
@@ -0,0 +1,166 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from itertools import islice
+from pathlib import Path
+from types import TracebackType
+from typing import Deque, Iterator, Optional, Sequence, Type
+
+from nasty_utils.io_ import DecompressingTextIOWrapper, DecompressorBackend
+
+
+class AsyncDecompressingTextIOWrapper:
+    """Asynchronous counterpart of DecompressingTextIOWrapper.
+
+    All blocking work (opening, reading, and decompressing the file) happens in
+    executor (or the default executor of the event loop), so that the event loop is
+    never blocked. Lines are transferred in batches of batch_size lines to keep the
+    overhead per line low, and the next batch is already read while the current one
+    is being consumed. The file is read in chunks of chunk_size bytes.
+
+    Use as "async with AsyncDecompressingTextIOWrapper(...) as fin:" and iterate with
+    "async for line in fin:". See DecompressingTextIOWrapper for the other arguments.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        encoding: str,
+        executor: Optional[Executor] = None,
+        batch_size: int = 1024,
+        chunk_size: int = 2 ** 20,  # 1 MiB
+        decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+        readahead: int = 0,
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+        progress_bar_interval: float = 0.1,
+    ):
+        self.path = path
+        self.encoding = encoding
+        self._executor = executor
+        self._batch_size = batch_size
+        self._chunk_size = chunk_size
+        self._decompressor = decompressor
+        self._readahead = readahead
+        self._warn_uncompressed = warn_uncompressed
+        self._progress_bar = progress_bar
+        self._progress_bar_desc = progress_bar_desc
+        self._progress_bar_interval = progress_bar_interval
+
+        self._fin: Optional[DecompressingTextIOWrapper] = None
+        self._lines: Optional[Iterator[str]] = None
+        self._buffer: Deque[str] = deque()
+        self._pending: "Optional[asyncio.Future[Sequence[str]]]" = None
+        self._eof = False
+        self._closed = False
+
+    def _read_batch(self) -> Sequence[str]:
+        if self._lines is None:
+            self._fin = DecompressingTextIOWrapper(
+                self.path,
+                encoding=self.encoding,
+                decompressor=self._decompressor,
+                readahead=self._readahead,
+                readahead_chunk_size=self._chunk_size,
+                warn_uncompressed=self._warn_uncompressed,
+                progress_bar=self._progress_bar,
+                progress_bar_desc=self._progress_bar_desc,
+                progress_bar_interval=self._progress_bar_interval,
+            )
+            # Size of the chunks TextIOWrapper reads from the underlying stream.
+            self._fin._CHUNK_SIZE = self._chunk_size  # type: ignore
+            self._lines = iter(self._fin)
+        return list(islice(self._lines, self._batch_size))
+
+    def _submit_batch(self) -> "asyncio.Future[Sequence[str]]":
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor, self._read_batch
+        )
+
+    async def read_batch(self) -> Sequence[str]:
+        """Returns the next up to batch_size lines, or an empty list at the end."""
+        if self._closed:
+            raise ValueError("I/O operation on closed reader.")
+        if self._buffer:
+            batch: Sequence[str] = list(self._buffer)
+            self._buffer.clear()
+            return batch
+        if self._eof:
+            return []
+
+        pending = self._pending or self._submit_batch()
+        self._pending = None
+        batch = await pending
+        if len(batch) < self._batch_size:
+            self._eof = True
+        else:
+            self._pending = self._submit_batch()
+        return batch
+
+    async def readline(self) -> str:
+        """Returns the next line, or an empty string at the end."""
+        if not self._buffer:
+            self._buffer.extend(await self.read_batch())
+        return self._buffer.popleft() if self._buffer else ""
+
+    def __aiter__(self) -> "AsyncDecompressingTextIOWrapper":
+        return self
+
+    async def __anext__(self) -> str:
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+    def tell(self) -> int:
+        """Tells the number of compressed bytes that have already been read.
+
+        Since reading happens ahead of consumption, this is an upper bound of the data
+        returned so far.
+        """
+        return self._fin.tell() if self._fin is not None else 0
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._pending is not None:
+            # Wait for the batch in flight so that it does not race with closing.
+            await asyncio.wait([self._pending])
+            self._pending = None
+        if self._fin is not None:
+            await asyncio.get_event_loop().run_in_executor(
+                self._executor, self._fin.close
+            )
+
+    async def __aenter__(self) -> "AsyncDecompressingTextIOWrapper":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
@@ -0,0 +1,343 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import json
+import os
+import sys
+from array import array
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+from pathlib import Path
+from shutil import rmtree
+from typing import (
+    Any,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+from xdg import XDG_CACHE_HOME
+
+from nasty_utils.download import sha256sum
+from nasty_utils.jsonl import JsonlReader, lookup_field
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+# Default directory of ColumnCache.
+COLUMN_CACHE_DIR = XDG_CACHE_HOME / "nasty-utils" / "columns"
+
+_META_FILE_NAME = "meta.json"
+_FORMAT_VERSION = 1
+
+# Column types with fixed-size values and their array typecodes.
+_FIXED_TYPECODES = {"bool": "B", "int": "q", "float": "d"}
+_INT64_RANGE = range(-(2 ** 63), 2 ** 63)
+
+
+def _map(path: Path, typecode: str) -> memoryview:
+    """Maps a file read-only into memory, viewed as an array of typecode."""
+    if path.stat().st_size == 0:
+        # Empty files can not be mapped.
+        return memoryview(b"").cast(typecode)
+    with path.open("rb") as fin:
+        return memoryview(mmap(fin.fileno(), 0, access=ACCESS_READ)).cast(typecode)
+
+
+def _column_type(values: Sequence[object]) -> str:
+    """Returns the narrowest column type that can hold all non-None values."""
+    present = [value for value in values if value is not None]
+    if not present:
+        return "json"
+    if all(isinstance(value, bool) for value in present):
+        return "bool"
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        if all(value in _INT64_RANGE for value in present):  # type: ignore
+            return "int"
+        return "json"
+    if all(
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        for value in present
+    ):
+        return "float"
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    return "json"
+
+
+class Column(Sequence[Any]):
+    """Read-only column of values of a field, backed by memory-mapped files.
+
+    Values of bool, int, and float columns are stored as arrays of the respective
+    machine type, which are exposed via buffer without copying (e.g., for passing
+    them to numpy.frombuffer()). Entries for which the field was missing or null are
+    returned as None (and are zero in buffer). Values of str and json columns are
+    decoded on access.
+    """
+
+    def __init__(
+        self,
+        type_: str,
+        *,
+        values: memoryview,
+        offsets: Optional[memoryview] = None,
+        valid: Optional[memoryview] = None,
+    ):
+        self.type = type_
+        self._values = values
+        self._offsets = offsets
+        self._valid = valid
+        self._len = len(offsets) - 1 if offsets is not None else len(values)
+
+    @property
+    def buffer(self) -> memoryview:
+        """Raw values of a bool, int, or float column."""
+        if self.type not in _FIXED_TYPECODES:
+            raise TypeError(f"Column of type '{self.type}' has no fixed-size values.")
+        return self._values
+
+    def _get(self, index: int) -> Any:
+        if self._valid is not None and not self._valid[index]:
+            return None
+        if self._offsets is None:
+            value = self._values[index]
+            return bool(value) if self.type == "bool" else value
+        data = bytes(self._values[self._offsets[index] : self._offsets[index + 1]])
+        return data.decode("UTF-8") if self.type == "str" else json.loads(data)
+
+    @overload
+    def __getitem__(self, index: int) -> Any:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Any]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("Column index out of range.")
+        return self._get(index)
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class ColumnCache:
+    """Persistent cache of selected fields of (compressed) JSON lines files.
+
+    The first time a set of fields is requested from a file, the file is parsed with
+    JsonlReader and the values of the fields are written into a column file each.
+    Subsequent requests map these files into memory instead of decompressing and
+    parsing the file again. Fields can be nested by separating keys with dots, e.g.,
+    "user.id".
+
+    Cache entries are keyed by the path of the source file and the requested fields,
+    and are validated against its size and modification time. If only the modification
+    time differs, the SHA-256 digest of the source is compared to the one recorded
+    when it was parsed, so that copying or touching files does not invalidate the
+    cache. Whenever the total size of the cache exceeds max_bytes, the least recently
+    used entries are deleted.
+    """
+
+    def __init__(
+        self, directory: Path = COLUMN_CACHE_DIR, *, max_bytes: int = 2 ** 34  # 16 GiB
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, path: Path, fields: Sequence[str]) -> Path:
+        key = json.dumps([_FORMAT_VERSION, str(path.resolve()), list(fields)])
+        return self.directory / hashlib.sha256(key.encode("UTF-8")).hexdigest()[:32]
+
+    def load(
+        self,
+        path: Path,
+        fields: Sequence[str],
+        *,
+        json_backend: Optional[str] = None,
+        skip_malformed: bool = False,
+    ) -> Mapping[str, Column]:
+        """Returns the columns of the given fields of all records in path."""
+        entry_dir = self._entry_dir(path, fields)
+        meta = self._read_valid_meta(entry_dir, path)
+        if meta is None:
+            _LOGGER.debug("Building column cache for file '{}'...", path)
+            meta = self._build(
+                entry_dir,
+                path,
+                fields,
+                json_backend=json_backend,
+                skip_malformed=skip_malformed,
+            )
+            self._evict(keep=entry_dir)
+        else:
+            _LOGGER.debug("Using column cache '{}' for file '{}'.", entry_dir, path)
+            # Marks the entry as recently used.
+            os.utime(entry_dir / _META_FILE_NAME)
+
+        return {
+            field: self._load_column(entry_dir, i, column_type, nullable)
+            for i, (field, column_type, nullable) in enumerate(meta["columns"])
+        }
+
+    def _read_valid_meta(
+        self, entry_dir: Path, path: Path
+    ) -> Optional[MutableMapping[str, Any]]:
+        meta_file = entry_dir / _META_FILE_NAME
+        try:
+            meta: MutableMapping[str, Any] = json.loads(
+                meta_file.read_text(encoding="UTF-8")
+            )
+        except (OSError, ValueError):
+            return None
+
+        stat = path.stat()
+        if meta["byteorder"] != sys.byteorder or meta["size"] != stat.st_size:
+            return None
+        if meta["mtime_ns"] != stat.st_mtime_ns:
+            if meta["sha256"] != sha256sum(path):
+                return None
+            meta["mtime_ns"] = stat.st_mtime_ns
+            meta_file.write_text(json.dumps(meta), encoding="UTF-8")
+        return meta
+
+    @classmethod
+    def _load_column(
+        cls, entry_dir: Path, i: int, column_type: str, nullable: bool
+    ) -> Column:
+        valid = _map(entry_dir / f"{i}.valid", "B") if nullable else None
+        if column_type in _FIXED_TYPECODES:
+            return Column(
+                column_type,
+                values=_map(entry_dir / f"{i}.values", _FIXED_TYPECODES[column_type]),
+                valid=valid,
+            )
+        return Column(
+            column_type,
+            values=_map(entry_dir / f"{i}.values", "B"),
+            offsets=_map(entry_dir / f"{i}.offsets", "Q"),
+            valid=valid,
+        )
+
+    @classmethod
+    def _build(
+        cls,
+        entry_dir: Path,
+        path: Path,
+        fields: Sequence[str],
+        *,
+        json_backend: Optional[str],
+        skip_malformed: bool,
+    ) -> MutableMapping[str, Any]:
+        stat = path.stat()
+        keys = [field.split(".") for field in fields]
+        columns: Sequence[MutableSequence[object]] = [[] for _ in fields]
+        with JsonlReader(
+            path,
+            json_backend=json_backend,
+            skip_malformed=skip_malformed,
+            checksum_algorithm="sha256",
+        ) as reader:
+            for record in reader:
+                for key, column in zip(keys, columns):
+                    column.append(lookup_field(record, key))
+            checksum = reader.checksum
+
+        tmp_dir = entry_dir.with_name(f"{entry_dir.name}.tmp-{os.getpid()}")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            column_meta = []
+            for i, (field, values) in enumerate(zip(fields, columns)):
+                column_type, nullable = cls._write_column(tmp_dir, i, values)
+                column_meta.append((field, column_type, nullable))
+
+            meta = {
+                "source": str(path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": checksum,
+                "byteorder": sys.byteorder,
+                "columns": column_meta,
+            }
+            (tmp_dir / _META_FILE_NAME).write_text(json.dumps(meta), encoding="UTF-8")
+
+            if entry_dir.exists():
+                rmtree(entry_dir)
+            tmp_dir.rename(entry_dir)
+        except BaseException:
+            rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return meta
+
+    @classmethod
+    def _write_column(
+        cls, directory: Path, i: int, values: Sequence[object]
+    ) -> Tuple[str, bool]:
+        column_type = _column_type(values)
+        nullable = column_type != "json" and any(value is None for value in values)
+        if nullable:
+            with (directory / f"{i}.valid").open("wb") as fout:
+                array("B", (value is not None for value in values)).tofile(fout)
+
+        with (directory / f"{i}.values").open("wb") as fout:
+            if column_type in _FIXED_TYPECODES:
+                array(
+                    _FIXED_TYPECODES[column_type],
+                    (0 if value is None else value for value in values),
+                ).tofile(fout)
+                return column_type, nullable
+
+            offsets = array("Q", [0])
+            for value in values:
+                if column_type == "str":
+                    data = b"" if value is None else str(value).encode("UTF-8")
+                else:
+                    data = json.dumps(value, ensure_ascii=False).encode("UTF-8")
+                fout.write(data)
+                offsets.append(offsets[-1] + len(data))
+        with (directory / f"{i}.offsets").open("wb") as fout:
+            offsets.tofile(fout)
+        return column_type, nullable
+
+    def _evict(self, *, keep: Path) -> None:
+        entries = []
+        total = 0
+        for entry_dir in self.directory.iterdir():
+            meta_file = entry_dir / _META_FILE_NAME
+            if not meta_file.exists():
+                continue
+            size = sum(file.stat().st_size for file in entry_dir.iterdir())
+            entries.append((meta_file.stat().st_mtime_ns, size, entry_dir))
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            _LOGGER.debug("Evicting column cache '{}'.", entry_dir)
+            rmtree(entry_dir, ignore_errors=True)
+            total -= size
@@ -0,0 +1,298 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import re
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from logging import getLogger
+from pathlib import Path
+from shutil import copyfileobj
+from tempfile import TemporaryDirectory
+from typing import BinaryIO, MutableMapping, Optional, Sequence, Tuple
+
+from overrides import overrides
+from tqdm import tqdm
+
+from nasty_utils._util.io_ import compressing_writer
+from nasty_utils.io_ import Compression, DecompressingBinaryReader
+from nasty_utils.jsonl import json_loads_function, lookup_field
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+from nasty_utils.program import Argument, ArgumentGroup, Program, ProgramConfig
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+
+class _LineMatcher:
+    def __init__(
+        self,
+        pattern: Optional[str],
+        field: Optional[str],
+        value_pattern: Optional[str],
+        ignore_case: bool,
+    ):
+        if pattern is None and field is None:
+            raise ValueError("Either pattern or field has to be given.")
+        if (field is None) != (value_pattern is None):
+            raise ValueError("Field and value_pattern have to be given together.")
+
+        flags = re.IGNORECASE if ignore_case else 0
+        self._regex = re.compile(pattern.encode("UTF-8"), flags) if pattern else None
+        self._value_regex = re.compile(value_pattern, flags) if value_pattern else None
+        self._keys = field.split(".") if field else []
+        self._loads = json_loads_function()
+
+    def matches(self, line: bytes) -> bool:
+        """Returns whether line matches, raises ValueError if it is malformed."""
+        if self._regex is not None and not self._regex.search(line):
+            return False
+        if self._value_regex is None:
+            return True
+        if line.isspace():
+            return False
+
+        value = lookup_field(self._loads(line), self._keys)
+        if value is None:
+            return False
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False)
+        return bool(self._value_regex.search(value))
+
+
+def grep_file(
+    source: Path,
+    destination: Path,
+    *,
+    pattern: Optional[str] = None,
+    field: Optional[str] = None,
+    value_pattern: Optional[str] = None,
+    ignore_case: bool = False,
+    skip_malformed: bool = False,
+    compression: Optional[Compression] = None,
+) -> Tuple[int, int]:
+    """Writes all lines of a (compressed) file that match regular expressions.
+
+    The pattern is searched for in the raw bytes of each line, so that non-matching
+    lines are skipped without decoding or parsing them. If field is given (with keys
+    separated by dots, e.g., "user.lang"), lines are additionally parsed as JSON and
+    value_pattern has to match the value of that field (strings as is, other values
+    JSON-encoded). For selective queries on fields, also passing a pattern that all
+    matching lines contain thus avoids parsing most lines. Lines that have to be parsed
+    but are malformed raise a ValueError naming the file and line, unless
+    skip_malformed is set, in which case they are only counted.
+
+    Output is compressed with the given compression (and not based on the extension of
+    destination). Returns the number of lines read and the number of matching lines.
+    """
+    matcher = _LineMatcher(pattern, field, value_pattern, ignore_case)
+
+    num_lines = 0
+    num_matches = 0
+    num_malformed = 0
+    with DecompressingBinaryReader(
+        source, warn_uncompressed=False
+    ) as fin, destination.open("wb") as fp:
+        fout = compressing_writer(
+            fp,
+            compression,
+            compression_level=None,
+            threads=0,
+            frame_size=None,
+            zstd_dict=None,
+        )
+        for line in fin:
+            num_lines += 1
+            try:
+                if not matcher.matches(line):
+                    continue
+            except ValueError as e:
+                if not skip_malformed:
+                    raise ValueError(
+                        f"Malformed JSON in line {num_lines} of file '{source}'."
+                    ) from e
+                num_malformed += 1
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            fout.write(line)
+            num_matches += 1
+        fout.close()
+
+    if num_malformed:
+        _LOGGER.warning(
+            "Skipped {} malformed out of {} lines in file '{}'.",
+            num_malformed,
+            num_lines,
+            source,
+        )
+    return num_lines, num_matches
+
+
+class GrepProgram(Program):
+    """Searches (compressed) files in parallel for lines matching regular expressions.
+
+    Meant to be included as one of the subprograms of another Program. Every file is
+    searched by a separate process (see grep_file()) into a temporary part file that
+    is compressed like the output file. Since concatenated gzip, bzip2, xz, and
+    Zstandard files are valid files themselves, part files are appended to the output
+    file without recompressing them, in the order of the files searched.
+    """
+
+    class Config(ProgramConfig):
+        title = "grep"
+        description = "Search compressed files for lines matching a pattern."
+
+    pattern: Optional[str] = Argument(
+        None,
+        short_alias="e",
+        metavar="REGEX",
+        description="Regular expression to search for in the raw bytes of each line.",
+        group=ArgumentGroup("Matching"),
+    )
+    field: Optional[str] = Argument(
+        None,
+        short_alias="f",
+        metavar="PATH",
+        description=(
+            "Parse lines as JSON and match the value of this field (keys separated "
+            "by dots) against --value."
+        ),
+        group=ArgumentGroup("Matching"),
+    )
+    value: Optional[str] = Argument(
+        None,
+        metavar="REGEX",
+        description="Regular expression the value of --field has to match.",
+        group=ArgumentGroup("Matching"),
+    )
+    ignore_case: bool = Argument(
+        False,
+        alias="ignore-case",
+        short_alias="i",
+        description="Match case-insensitively.",
+        group=ArgumentGroup("Matching"),
+    )
+    skip_malformed: bool = Argument(
+        False,
+        alias="skip-malformed",
+        description="Skip lines that are not valid JSON when matching --field.",
+        group=ArgumentGroup("Matching"),
+    )
+    source: Path = Argument(
+        short_alias="s",
+        metavar="PATH",
+        description="File or directory that is searched recursively for files.",
+    )
+    glob: str = Argument(
+        "*",
+        metavar="PATTERN",
+        description="Only search files in source whose name matches this pattern.",
+    )
+    output: Path = Argument(
+        short_alias="o",
+        metavar="FILE",
+        description="File to write matching lines to, compressed based on its suffix.",
+    )
+    workers: Optional[int] = Argument(
+        None,
+        short_alias="j",
+        metavar="N",
+        description="Number of processes to use (default: number of CPUs).",
+    )
+
+    def _find_files(self) -> Sequence[Path]:
+        if self.source.is_file():
+            return [self.source]
+        return sorted(path for path in self.source.rglob(self.glob) if path.is_file())
+
+    def _search(
+        self, files: Sequence[Path], compression: Optional[Compression], fout: BinaryIO
+    ) -> Tuple[int, int]:
+        num_lines = 0
+        num_matches = 0
+        with TemporaryDirectory(
+            prefix="nasty-utils-grep-", dir=str(self.output.parent)
+        ) as tmp, ProcessPoolExecutor(max_workers=self.workers) as executor, tqdm(
+            desc="Searching",
+            total=sum(file.stat().st_size for file in files),
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            dynamic_ncols=True,
+        ) as progress_bar:
+            parts = [Path(tmp) / f"part-{i}" for i in range(len(files))]
+            futures: MutableMapping[Future[Tuple[int, int]], int] = {
+                executor.submit(
+                    grep_file,
+                    file,
+                    part,
+                    pattern=self.pattern,
+                    field=self.field,
+                    value_pattern=self.value,
+                    ignore_case=self.ignore_case,
+                    skip_malformed=self.skip_malformed,
+                    compression=compression,
+                ): i
+                for i, (file, part) in enumerate(zip(files, parts))
+            }
+
+            done = [False] * len(files)
+            next_part = 0
+            for future in as_completed(futures):
+                i = futures[future]
+                file_lines, file_matches = future.result()
+                num_lines += file_lines
+                num_matches += file_matches
+                progress_bar.update(files[i].stat().st_size)
+
+                # Append parts in the order of files, so that the output is the same
+                # as if the files had been searched sequentially.
+                done[i] = True
+                while next_part < len(files) and done[next_part]:
+                    with parts[next_part].open("rb") as fin:
+                        copyfileobj(fin, fout)
+                    parts[next_part].unlink()
+                    next_part += 1
+        return num_lines, num_matches
+
+    @overrides
+    def run(self) -> None:
+        if self.pattern is None and self.field is None:
+            raise ValueError("Either --pattern or --field has to be given.")
+        if (self.field is None) != (self.value is None):
+            raise ValueError("Arguments --field and --value have to be given together.")
+
+        files = self._find_files()
+        _LOGGER.info("Searching {} files in '{}'.", len(files), self.source)
+
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.output.with_name(self.output.name + ".tmp")
+        try:
+            with tmp_path.open("wb") as fout:
+                num_lines, num_matches = self._search(
+                    files, Compression.from_suffix(self.output), fout
+                )
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        tmp_path.replace(self.output)
+
+        _LOGGER.info(
+            "Found {} matching out of {} lines, written to '{}'.",
+            num_matches,
+            num_lines,
+            self.output,
+        )
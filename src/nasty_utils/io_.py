@@ -14,61 +14,920 @@
 # limitations under the License.
 #
 
-from bz2 import BZ2File
-from gzip import GzipFile
-from io import TextIOWrapper
+import hashlib
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from functools import lru_cache
+from glob import glob
+from io import DEFAULT_BUFFER_SIZE, BufferedReader, RawIOBase, TextIOWrapper
 from logging import getLogger
-from lzma import LZMAFile
+from mmap import ACCESS_READ, mmap
 from pathlib import Path
+from queue import Full, Queue
+from random import Random
+from shutil import which
+from subprocess import PIPE, Popen
+from tempfile import TemporaryFile
+from threading import Event, Thread
+from time import monotonic, perf_counter
 from types import TracebackType
-from typing import BinaryIO, Optional, Type, cast
+from typing import (
+    IO,
+    AnyStr,
+    BinaryIO,
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 from overrides import overrides
 from tqdm import tqdm
-from zstandard import ZstdDecompressor
+from xdg import XDG_CACHE_HOME
+from zstandard import ZstdCompressionDict, train_dictionary
 
+from nasty_utils._util.io_ import (  # noqa: F401 (re-exported as part of this API)
+    ZSTD_DICT_FILE_NAME,
+    Compression,
+    compressing_writer,
+    decompressing_reader,
+    find_zstd_dict,
+    zstd_dict_for,
+)
+from nasty_utils._util.logging_ import dynamic_filename_args
 from nasty_utils.logging_ import ColoredBraceStyleAdapter
 
+try:
+    from mmap import MADV_SEQUENTIAL
+except ImportError:  # Python < 3.8
+    MADV_SEQUENTIAL = None
+
 _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
 
-class DecompressingTextIOWrapper(TextIOWrapper):
-    # TODO: implement write access
+_MAGIC_BYTES_LEN = 6
+
+
+def detect_compression(path: Path) -> Optional[Compression]:
+    """Detects the compression of a file by looking at its first bytes.
+
+    Results are cached per path and modification time, so that repeatedly opening the
+    same file only reads its header once.
+    """
+    return _detect_compression(path, path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=4096)
+def _detect_compression(path: Path, _mtime_ns: int) -> Optional[Compression]:
+    with path.open("rb") as fin:
+        return Compression.from_magic_bytes(fin.read(_MAGIC_BYTES_LEN))
+
+
+def train_zstd_dict(
+    paths: Iterable[Path],
+    *,
+    dict_size: int = 112640,  # 110 KiB, the default of the zstd binary.
+    max_samples: Optional[int] = None,
+    seed: int = 0,
+) -> ZstdCompressionDict:
+    """Trains a Zstandard dictionary on the (decompressed) contents of files.
+
+    If max_samples is given, only a random subset of that many files is used. Save the
+    dictionary as ZSTD_DICT_FILE_NAME next to the data for it to be found when reading
+    (see find_zstd_dict()), and pass it as zstd_dict to CompressingTextIOWrapper.
+    """
+    paths = list(paths)
+    if max_samples is not None and len(paths) > max_samples:
+        paths = Random(seed).sample(paths, max_samples)
+
+    samples = []
+    for path in paths:
+        with DecompressingBinaryReader(path, warn_uncompressed=False) as fin:
+            samples.append(fin.read())
+    _LOGGER.debug("Training Zstandard dictionary on {} files.", len(samples))
+    return train_dictionary(dict_size, samples)
+
+
+class DecompressorBackend(Enum):
+    """Selects how files are decompressed.
+
+    PYTHON uses the codecs of the standard library and zstandard. EXTERNAL pipes the
+    file through a decompressor binary (e.g., pigz or lbzip2), which runs in a
+    separate process and is often considerably faster. AUTO uses EXTERNAL if a
+    suitable binary is installed and notably faster, and PYTHON otherwise.
+    """
+
+    PYTHON = "python"
+    EXTERNAL = "external"
+    AUTO = "auto"
+
+
+# In order of preference.
+_EXTERNAL_DECOMPRESSORS: Mapping[Compression, Sequence[Sequence[str]]] = {
+    Compression.GZIP: (("pigz", "-dc"), ("igzip", "-dc")),
+    Compression.BZIP2: (("lbzip2", "-dc"), ("pbzip2", "-dc")),
+    Compression.XZ: (("xz", "-dc", "-T0"),),
+    Compression.ZSTD: (("zstd", "-dcq"),),
+}
+
+# Compressions for which the external decompressors are notably faster than the
+# in-process codecs (mostly by being multi-threaded), and thus used by AUTO. zstd
+# only compresses multi-threaded and is slower than zstandard due to the piping.
+_AUTO_EXTERNAL_COMPRESSIONS = frozenset(
+    {Compression.GZIP, Compression.BZIP2, Compression.XZ}
+)
+
+
+@lru_cache(maxsize=None)
+def _find_external_decompressor(compression: Compression) -> Optional[Sequence[str]]:
+    for command in _EXTERNAL_DECOMPRESSORS[compression]:
+        executable = which(command[0])
+        if executable:
+            return (executable, *command[1:])
+    return None
+
+
+class _ExternalDecompressor(RawIOBase):
+    """Decompresses a stream by piping it through an external process.
+
+    The compressed data is fed to the process by a background thread, so that the
+    number of compressed bytes consumed is known at all times.
+    """
+
+    # Number of bytes at the end of stderr included in errors.
+    _MAX_ERROR_SIZE = 4096
+
+    def __init__(
+        self, fp: BinaryIO, command: Sequence[str], *, chunk_size: int = 2 ** 20
+    ):
+        super().__init__()
+        self._fp = fp
+        self._command = command
+        self._chunk_size = chunk_size
+        # A file instead of a pipe, so that the process can not block on writing lots
+        # of warnings while we only read its stdout.
+        self._stderr = TemporaryFile()
+        self._process = Popen(
+            command, stdin=PIPE, stdout=PIPE, stderr=self._stderr, bufsize=0
+        )
+        self._exception: Optional[BaseException] = None
+        self.compressed_position = 0
+
+        self._thread = Thread(target=self._feed, name="decompressor-feed", daemon=True)
+        self._thread.start()
+
+    def _feed(self) -> None:
+        stdin = cast(IO[bytes], self._process.stdin)
+        try:
+            for data in iter(lambda: self._fp.read(self._chunk_size), b""):
+                stdin.write(data)
+                self.compressed_position += len(data)
+        except BrokenPipeError:
+            # Process exited early, either due to an error or because we were closed.
+            pass
+        except BaseException as e:
+            self._exception = e
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        n = cast(IO[bytes], self._process.stdout).readinto(b)  # type: ignore
+        if n:
+            return cast(int, n)
+
+        self._thread.join()
+        if self._exception is not None:
+            raise self._exception
+        if self._process.wait():
+            # Only the end of the output, which should contain the actual error.
+            self._stderr.seek(max(0, self._stderr.seek(0, 2) - self._MAX_ERROR_SIZE))
+            stderr = self._stderr.read().decode(errors="replace")
+            raise OSError(
+                f"Command '{' '.join(self._command)}' exited with code "
+                f"{self._process.returncode}: {stderr}"
+            )
+        return 0
+
+    @overrides
+    def close(self) -> None:
+        if not self.closed:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._thread.join()
+            self._process.wait()
+            cast(IO[bytes], self._process.stdout).close()
+            self._stderr.close()
+        super().close()
+
+
+def _open_decompressor(
+    path: Optional[Path],
+    fp: BinaryIO,
+    compression: Optional[Compression],
+    backend: DecompressorBackend,
+    zstd_dict: Optional[ZstdCompressionDict],
+) -> Tuple[BinaryIO, Callable[[], int]]:
+    """Returns a stream of the decompressed data of fp.
+
+    Also returns a function that gives the number of compressed bytes consumed.
+    """
+    if compression == Compression.ZSTD and zstd_dict is None:
+        zstd_dict = zstd_dict_for(path, fp)
+
+    # External decompressors could only be given dictionaries as files.
+    if (
+        compression is not None
+        and zstd_dict is None
+        and (
+            backend == DecompressorBackend.EXTERNAL
+            or (
+                backend == DecompressorBackend.AUTO
+                and compression in _AUTO_EXTERNAL_COMPRESSIONS
+            )
+        )
+    ):
+        command = _find_external_decompressor(compression)
+        if command is not None:
+            _LOGGER.debug("Decompressing with '{}'.", " ".join(command))
+            fin = _ExternalDecompressor(fp, command)
+            return cast(BinaryIO, fin), lambda: fin.compressed_position
+        elif backend == DecompressorBackend.EXTERNAL:
+            raise FileNotFoundError(
+                f"None of the external decompressors for {compression.name} are "
+                f"installed: "
+                + ", ".join(cmd[0] for cmd in _EXTERNAL_DECOMPRESSORS[compression])
+            )
+    return decompressing_reader(fp, compression, zstd_dict), fp.tell
+
+
+class _ReadaheadReader(RawIOBase):
+    """Reads chunks from another stream in a background thread.
+
+    Since all supported decompressors release the GIL, this allows decompressing the
+    next chunks while the consumer is still processing the current one. At most depth
+    chunks are buffered.
+    """
 
     def __init__(
         self,
-        path: Path,
+        fin: BinaryIO,
         *,
-        encoding: str,
-        warn_uncompressed: bool = True,
-        progress_bar: bool = False,
-        progress_bar_desc: Optional[str] = None,
+        position: Callable[[], int],
+        depth: int,
+        chunk_size: int,
     ):
-        self.path = path
+        super().__init__()
+        self._fin = fin
+        self._position = position
+        self._chunk_size = chunk_size
+
+        # Each item is either a chunk of data together with the compressed position
+        # after reading it, or the exception that occurred while reading.
+        self._queue: "Queue[Union[Tuple[bytes, int], BaseException]]" = Queue(
+            maxsize=depth
+        )
+        self._stop = Event()
+        self._buffer = memoryview(b"")
+        self._eof = False
+        # The thread exits after an error, so it is kept to raise it on every read.
+        self._error: Optional[BaseException] = None
+        self.compressed_position = 0
+
+        self._thread = Thread(target=self._run, name="readahead", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                data = self._fin.read(self._chunk_size)
+                self._put((data, self._position()))
+                if not data:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item: Union[Tuple[bytes, int], BaseException]) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def _fill_buffer(self) -> None:
+        if self._buffer or self._eof:
+            return
+        if self._error is not None:
+            raise self._error
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            self._error = item
+            raise item
+        data, self.compressed_position = item
+        self._eof = not data
+        self._buffer = memoryview(data)
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        self._fill_buffer()
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def read1(self, size: int = -1) -> bytes:
+        # Used by TextIOWrapper, allows to hand out whole chunks without copying them
+        # into an intermediate buffer.
+        self._fill_buffer()
+        n = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+        result = self._buffer[:n].tobytes()
+        self._buffer = self._buffer[n:]
+        return result
+
+    @overrides
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+
+def _detect_compression_and_warn(
+    path: Path, *, warn_uncompressed: bool
+) -> Optional[Compression]:
+    compression = detect_compression(path)
+    if compression is None and warn_uncompressed:  # pragma: no cover
+        _LOGGER.warning(
+            "Could not detect compression type of file '{}' from its contents, "
+            "treating as uncompressed file.",
+            path,
+        )
+    elif compression != Compression.from_suffix(path):
+        _LOGGER.debug(
+            "Compression type of file '{}' does not match its extension, "
+            "treating as {}.",
+            path,
+            compression.name if compression else "uncompressed",
+        )
+    return compression
+
+
+class ChecksumMismatchError(Exception):
+    pass
+
+
+class _CountingReader(RawIOBase):
+    """Counts the bytes read from another stream, which might not support tell()."""
+
+    def __init__(self, fp: BinaryIO):
+        super().__init__()
+        self._fp = fp
+        self._position = 0
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        n = cast(int, self._fp.readinto(b))  # type: ignore
+        self._position += n
+        return n
+
+    @overrides
+    def tell(self) -> int:
+        return self._position
+
+    @overrides
+    def close(self) -> None:
+        self._fp.close()
+        super().close()
+
+
+class _HashingReader(_CountingReader):
+    """Hashes all data that is read from another stream."""
+
+    def __init__(self, fp: BinaryIO, hash_: "hashlib._Hash"):
+        super().__init__(fp)
+        self._hash = hash_
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        n = super().readinto(b)
+        self._hash.update(memoryview(b)[:n])
+        return n
+
+    def hexdigest(self) -> str:
+        """Hashes the remaining data of the stream and returns the digest."""
+        for data in iter(lambda: self._fp.read(2 ** 20), b""):
+            self._hash.update(data)
+            self._position += len(data)
+        return self._hash.hexdigest()
+
+
+class _ChecksumVerifyingReader(RawIOBase):
+    """Computes the checksum of the compressed data when the decompressed data ends.
+
+    Raises ChecksumMismatchError if it does not match the expected checksum.
+    """
+
+    def __init__(
+        self,
+        fin: BinaryIO,
+        hashing: _HashingReader,
+        *,
+        name: str,
+        expected_checksum: Optional[str],
+    ):
+        super().__init__()
+        self._fin = fin
+        self._hashing = hashing
+        self._name = name
+        self._expected_checksum = expected_checksum
+        self.checksum: Optional[str] = None
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        n = cast(int, self._fin.readinto(b))  # type: ignore
+        if n or self.checksum is not None:
+            return n
+
+        self.checksum = self._hashing.hexdigest()
+        if (
+            self._expected_checksum is not None
+            and self.checksum != self._expected_checksum.lower()
+        ):
+            raise ChecksumMismatchError(
+                f"Checksum of '{self._name}' is {self.checksum}, expected "
+                f"{self._expected_checksum}."
+            )
+        return 0
+
+
+class _ConcatenatingReader(RawIOBase):
+    """Reads the decompressed contents of several files one after another."""
+
+    def __init__(
+        self,
+        paths: Sequence[Path],
+        *,
+        decompressor: DecompressorBackend,
+        zstd_dict: Optional[ZstdCompressionDict],
+        warn_uncompressed: bool,
+    ):
+        super().__init__()
+        self._paths = paths
+        self._decompressor = decompressor
+        self._zstd_dict = zstd_dict
+        self._warn_uncompressed = warn_uncompressed
+        self._next_path = 0
+        self._fp: Optional[BinaryIO] = None
+        self._fin: Optional[BinaryIO] = None
+        self._position: Optional[Callable[[], int]] = None
+        self._current_size = 0
+        self._finished_size = 0
 
+    def compressed_position(self) -> int:
+        return self._finished_size + (self._position() if self._position else 0)
+
+    def _open_next(self) -> bool:
+        if self._next_path == len(self._paths):
+            return False
+        path = self._paths[self._next_path]
+        self._next_path += 1
+
+        compression = _detect_compression_and_warn(
+            path, warn_uncompressed=self._warn_uncompressed
+        )
         self._fp = path.open("rb")
-        self._fin: BinaryIO
-        if path.suffix == ".gz":
-            self._fin = cast(BinaryIO, GzipFile(fileobj=self._fp))
-        elif path.suffix == ".bz2":
-            self._fin = cast(BinaryIO, BZ2File(self._fp))
-        elif path.suffix == ".xz":
-            self._fin = cast(BinaryIO, LZMAFile(self._fp))
-        elif path.suffix == ".zst":
-            self._fin = cast(BinaryIO, ZstdDecompressor().stream_reader(self._fp))
+        self._fin, self._position = _open_decompressor(
+            path, self._fp, compression, self._decompressor, self._zstd_dict
+        )
+        self._current_size = path.stat().st_size
+        return True
+
+    def _close_current(self) -> None:
+        if self._fp is not None and self._fin is not None:
+            self._fin.close()
+            self._fp.close()
+            self._finished_size += self._current_size
+        self._fp = None
+        self._fin = None
+        self._position = None
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        while True:
+            if self._fin is None and not self._open_next():
+                return 0
+            n = cast(int, cast(BinaryIO, self._fin).readinto(b))  # type: ignore
+            if n:
+                return n
+            self._close_current()
+
+    @overrides
+    def close(self) -> None:
+        self._close_current()
+        super().close()
+
+
+# Persistent cache of the results of count_lines().
+LINE_COUNT_CACHE_FILE = XDG_CACHE_HOME / "nasty-utils" / "line-counts.sqlite3"
+
+
+def count_lines(
+    path: Path,
+    *,
+    cache: bool = True,
+    decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+    chunk_size: int = 2 ** 22,  # 4 MiB
+) -> int:
+    """Counts the lines of a (compressed) file.
+
+    The file is decompressed in blocks of chunk_size bytes, in which newlines are
+    counted without decoding them. A last line without a trailing newline is counted
+    as well. Results are cached persistently in LINE_COUNT_CACHE_FILE, keyed by the
+    path, size, modification time, and inode of the file.
+    """
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    if cache:
+        num_lines = _LineCountCache.get(key)
+        if num_lines is not None:
+            return num_lines
+
+    num_lines = 0
+    last = b"\n"
+    with path.open("rb") as fp:
+        fin, _ = _open_decompressor(
+            path, fp, detect_compression(path), decompressor, None
+        )
+        with fin:
+            for data in iter(lambda: fin.read(chunk_size), b""):
+                num_lines += data.count(b"\n")
+                last = data[-1:]
+    if last != b"\n":
+        num_lines += 1
+
+    if cache:
+        _LineCountCache.put(key, num_lines)
+    return num_lines
+
+
+class _LineCountCache:
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS line_counts (path TEXT PRIMARY KEY, size INTEGER, "
+        "mtime_ns INTEGER, inode INTEGER, num_lines INTEGER)"
+    )
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        LINE_COUNT_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(LINE_COUNT_CACHE_FILE), timeout=30)
+        connection.execute(cls._SCHEMA)
+        return connection
+
+    @classmethod
+    def get(cls, key: Tuple[str, int, int, int]) -> Optional[int]:
+        with closing(cls._connect()) as connection:
+            row = connection.execute(
+                "SELECT num_lines FROM line_counts "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                key,
+            ).fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def put(cls, key: Tuple[str, int, int, int], num_lines: int) -> None:
+        with closing(cls._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO line_counts VALUES (?, ?, ?, ?, ?)",
+                (*key, num_lines),
+            )
+
+
+@dataclass
+class ReaderStats:
+    """Throughput statistics of a decompressing reader.
+
+    Time is split from the perspective of the consumer: decompression_seconds is the
+    time spent waiting for decompressed data (including disk I/O, or waiting for the
+    read-ahead thread), decoding_seconds the remaining time spent in the reader (e.g.,
+    decoding and splitting lines), and caller_seconds the time spent outside of the
+    reader. If the caller is the bottleneck, the job is bound by parsing/processing.
+    """
+
+    compressed_bytes: int = 0
+    decompressed_bytes: int = 0
+    lines: int = 0
+    elapsed_seconds: float = 0.0
+    read_seconds: float = 0.0
+    decompression_seconds: float = 0.0
+
+    @property
+    def decoding_seconds(self) -> float:
+        return max(self.read_seconds - self.decompression_seconds, 0.0)
+
+    @property
+    def caller_seconds(self) -> float:
+        return max(self.elapsed_seconds - self.read_seconds, 0.0)
+
+    @property
+    def compressed_mib_per_second(self) -> float:
+        return self.compressed_bytes / 2 ** 20 / (self.elapsed_seconds or 1e-9)
+
+    @property
+    def decompressed_mib_per_second(self) -> float:
+        return self.decompressed_bytes / 2 ** 20 / (self.elapsed_seconds or 1e-9)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.lines} lines, {self.compressed_bytes / 2 ** 20:.1f} MiB "
+            f"compressed, {self.decompressed_bytes / 2 ** 20:.1f} MiB decompressed in "
+            f"{self.elapsed_seconds:.2f}s ({self.compressed_mib_per_second:.1f} MiB/s "
+            f"compressed, {self.decompressed_mib_per_second:.1f} MiB/s "
+            f"decompressed). Time spent: {self.decompression_seconds:.2f}s "
+            f"decompression, {self.decoding_seconds:.2f}s decoding, "
+            f"{self.caller_seconds:.2f}s caller."
+        )
+
+
+class _TimingReader(RawIOBase):
+    """Measures the time spent reading from another stream."""
+
+    def __init__(self, fin: BinaryIO, stats: ReaderStats):
+        super().__init__()
+        self._fin = fin
+        self._stats = stats
+
+    @overrides
+    def readable(self) -> bool:
+        return True
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        start = perf_counter()
+        n = cast(int, self._fin.readinto(b))  # type: ignore
+        self._stats.decompression_seconds += perf_counter() - start
+        self._stats.decompressed_bytes += n
+        return n
+
+    def read1(self, size: int = -1) -> bytes:
+        # See _ReadaheadReader.read1().
+        start = perf_counter()
+        read1 = getattr(self._fin, "read1", self._fin.read)
+        result = cast(bytes, read1(size))
+        self._stats.decompression_seconds += perf_counter() - start
+        self._stats.decompressed_bytes += len(result)
+        return result
+
+
+class _DecompressingReaderMixin:
+    """Shared implementation of the decompressing readers."""
+
+    # Number of lines after which progress and stats are updated when iterating.
+    _ITER_BATCH_SIZE = 1024
+
+    def _open_decompressing(
+        self,
+        path: Union[str, Path, BinaryIO],
+        *,
+        decompressor: DecompressorBackend,
+        zstd_dict: Optional[ZstdCompressionDict],
+        checksum_algorithm: Optional[str],
+        expected_checksum: Optional[str],
+        readahead: int,
+        readahead_chunk_size: int,
+        warn_uncompressed: bool,
+        progress_bar: bool,
+        progress_bar_desc: Optional[str],
+        progress_bar_interval: float,
+        progress_bar_lines: bool,
+        stats: bool,
+        log_stats: bool,
+    ) -> BinaryIO:
+        """Opens path and returns the stream of decompressed data to wrap.
+
+        Instead of a path, path may also be a readable binary stream (e.g., a pipe),
+        in which case self.path is None.
+        """
+        if isinstance(path, str):
+            path = Path(path)
+        if not isinstance(path, Path) and not hasattr(path, "readinto"):
+            raise TypeError(
+                "Expected a path or a readable binary stream, got "
+                f"'{type(path).__name__}'."
+            )
+
+        if isinstance(path, Path):
+            self.path: Optional[Path] = path
+            self._name = str(path)
+            self.compression = _detect_compression_and_warn(
+                path, warn_uncompressed=warn_uncompressed
+            )
+            raw = cast(BinaryIO, path.open("rb"))
         else:
-            if warn_uncompressed:  # pragma: no cover
+            self.path = None
+            self._name = str(getattr(path, "name", "<stream>"))
+            # Streams may not support tell(), so count the bytes read ourselves.
+            raw = cast(BinaryIO, _CountingReader(path))
+
+        try:
+            return self._open_decompressing_stream(
+                raw,
+                decompressor=decompressor,
+                zstd_dict=zstd_dict,
+                checksum_algorithm=checksum_algorithm,
+                expected_checksum=expected_checksum,
+                readahead=readahead,
+                readahead_chunk_size=readahead_chunk_size,
+                warn_uncompressed=warn_uncompressed,
+                progress_bar=progress_bar,
+                progress_bar_desc=progress_bar_desc,
+                progress_bar_interval=progress_bar_interval,
+                progress_bar_lines=progress_bar_lines,
+                stats=stats,
+                log_stats=log_stats,
+            )
+        except BaseException:
+            raw.close()
+            raise
+
+    def _open_decompressing_stream(
+        self,
+        raw: BinaryIO,
+        *,
+        decompressor: DecompressorBackend,
+        zstd_dict: Optional[ZstdCompressionDict],
+        checksum_algorithm: Optional[str],
+        expected_checksum: Optional[str],
+        readahead: int,
+        readahead_chunk_size: int,
+        warn_uncompressed: bool,
+        progress_bar: bool,
+        progress_bar_desc: Optional[str],
+        progress_bar_interval: float,
+        progress_bar_lines: bool,
+        stats: bool,
+        log_stats: bool,
+    ) -> BinaryIO:
+
+        hashing: Optional[_HashingReader] = None
+        if checksum_algorithm is not None or expected_checksum is not None:
+            hashing = _HashingReader(raw, hashlib.new(checksum_algorithm or "sha256"))
+            raw = cast(BinaryIO, hashing)
+        self._fp = (
+            cast(BinaryIO, BufferedReader(raw))  # type: ignore
+            if hashing is not None or self.path is None
+            else raw
+        )
+
+        if self.path is None:
+            self.compression = Compression.from_magic_bytes(
+                cast(BufferedReader, self._fp).peek(_MAGIC_BYTES_LEN)
+            )
+            if self.compression is None and warn_uncompressed:  # pragma: no cover
                 _LOGGER.warning(
-                    "Could not detect compression type of file '{}' from its "
-                    "extension, treating as uncompressed file.",
-                    path,
+                    "Could not detect compression type of stream '{}' from its "
+                    "contents, treating as uncompressed.",
+                    self._name,
                 )
-            self._fin = self._fp
 
+        self._checksum_verifier: Optional[_ChecksumVerifyingReader] = None
+        self._fin, position = _open_decompressor(
+            self.path, self._fp, self.compression, decompressor, zstd_dict
+        )
+        fin = self._fin
+        if hashing is not None:
+            self._checksum_verifier = _ChecksumVerifyingReader(
+                self._fin, hashing, name=self._name, expected_checksum=expected_checksum
+            )
+            fin = cast(BinaryIO, self._checksum_verifier)
+
+        return self._setup_decompressing(
+            fin,
+            streams=(self._fin, self._fp),
+            position=position,
+            readahead=readahead,
+            readahead_chunk_size=readahead_chunk_size,
+            progress_bar=progress_bar,
+            progress_bar_desc=(
+                progress_bar_desc or (self.path.name if self.path else self._name)
+            ),
+            progress_bar_interval=progress_bar_interval,
+            progress_bar_lines=progress_bar_lines,
+            stats=stats,
+            log_stats=log_stats,
+        )
+
+    def _setup_decompressing(
+        self,
+        fin: BinaryIO,
+        *,
+        streams: Sequence[IO[bytes]],
+        position: Callable[[], int],
+        readahead: int,
+        readahead_chunk_size: int,
+        progress_bar: bool,
+        progress_bar_desc: str,
+        progress_bar_interval: float,
+        progress_bar_lines: bool,
+        stats: bool,
+        log_stats: bool,
+    ) -> BinaryIO:
+        """Sets up read-ahead, progress bar, and stats for reading decompressed data.
+
+        The given position function returns the number of compressed bytes read, the
+        given streams are closed in order when the reader is closed.
+        """
+        self._streams = streams
+        self._position = position
+        self._readahead: Optional[_ReadaheadReader] = None
         self._progress_bar: Optional[tqdm[None]] = None
-        if progress_bar:
+        try:
+            return self._setup_decompressing_stream(
+                fin,
+                position=position,
+                readahead=readahead,
+                readahead_chunk_size=readahead_chunk_size,
+                progress_bar=progress_bar,
+                progress_bar_desc=progress_bar_desc,
+                progress_bar_interval=progress_bar_interval,
+                progress_bar_lines=progress_bar_lines,
+                stats=stats,
+                log_stats=log_stats,
+            )
+        except BaseException:
+            self._release_decompressing()
+            raise
+
+    def _setup_decompressing_stream(
+        self,
+        fin: BinaryIO,
+        *,
+        position: Callable[[], int],
+        readahead: int,
+        readahead_chunk_size: int,
+        progress_bar: bool,
+        progress_bar_desc: str,
+        progress_bar_interval: float,
+        progress_bar_lines: bool,
+        stats: bool,
+        log_stats: bool,
+    ) -> BinaryIO:
+        if readahead > 0:
+            self._readahead = _ReadaheadReader(
+                fin, position=position, depth=readahead, chunk_size=readahead_chunk_size
+            )
+
+        self._progress_bar_interval = progress_bar_interval
+        self._progress_bar_next_update = 0.0
+        self._progress_bar_lines = progress_bar and progress_bar_lines
+        if self._progress_bar_lines:
             self._progress_bar = tqdm(
-                desc=progress_bar_desc or self.path.name,
+                desc=progress_bar_desc,
+                total=self.num_lines(),
+                unit="lines",
+                unit_scale=True,
+                dynamic_ncols=True,
+            )
+        elif progress_bar:
+            self._progress_bar = tqdm(
+                desc=progress_bar_desc,
                 total=self.size(),
                 unit="B",
                 unit_scale=True,
@@ -76,33 +935,179 @@ class DecompressingTextIOWrapper(TextIOWrapper):
                 dynamic_ncols=True,
             )
 
-        super().__init__(self._fin, encoding=encoding)
+        stream = cast(BinaryIO, self._readahead) if self._readahead else fin
 
-    def size(self) -> int:
-        return self.path.stat().st_size
+        self._lines_read = 0
+        self._stats: Optional[ReaderStats] = None
+        self._log_stats = log_stats
+        self._stats_start = perf_counter()
+        if stats or log_stats:
+            self._stats = ReaderStats()
+            stream = cast(BinaryIO, _TimingReader(stream, self._stats))
+        # Only count lines in read() etc. if needed, since it is not free. Without
+        # stats or a progress bar, reads are not tracked at all.
+        self._count_lines = self._stats is not None or self._progress_bar_lines
+        self._track_reads = self._stats is not None or self._progress_bar is not None
+        return stream
+
+    @property
+    def stats(self) -> Optional[ReaderStats]:
+        """Throughput statistics, only collected if stats or log_stats was set."""
+        if self._stats is not None and not cast(IO[bytes], self).closed:
+            self._stats.compressed_bytes = self._compressed_position()
+            self._stats.elapsed_seconds = perf_counter() - self._stats_start
+        return self._stats
+
+    def _after_read(self, start: float, lines: int) -> None:
+        self._record_read(perf_counter() - start, lines)
+
+    def _record_read(self, seconds: float, lines: int) -> None:
+        self._lines_read += lines
+        if self._stats is not None:
+            self._stats.read_seconds += seconds
+            self._stats.lines += lines
+        self._update_progress_bar()
+
+    def _iter_batched(
+        self, readline: Callable[[], AnyStr], sentinel: AnyStr
+    ) -> Iterator[AnyStr]:
+        """Iterates over lines, only updating progress and stats once per batch.
 
+        Lines are returned as soon as they are read, so that none are lost if the
+        caller stops iterating early. The time spent reading is only measured if stats
+        are collected.
+        """
+        lines = 0
+        seconds = 0.0
+        try:
+            if self._stats is None:
+                for line in iter(readline, sentinel):
+                    lines += 1
+                    if lines == self._ITER_BATCH_SIZE:
+                        self._record_read(0.0, lines)
+                        lines = 0
+                    yield line
+                return
+
+            while True:
+                start = perf_counter()
+                line = readline()
+                seconds += perf_counter() - start
+                if line == sentinel:
+                    return
+                lines += 1
+                if lines == self._ITER_BATCH_SIZE:
+                    self._record_read(seconds, lines)
+                    lines = 0
+                    seconds = 0.0
+                yield line
+        finally:
+            if lines or seconds:
+                self._record_read(seconds, lines)
+
+    def size(self) -> Optional[int]:
+        """Returns the compressed size, or None if reading from a stream."""
+        return self.path.stat().st_size if self.path else None
+
+    def num_lines(self) -> int:
+        """Returns the number of lines in the file, see count_lines()."""
+        if self.path is None:
+            raise ValueError("Can not count lines of a stream in advance.")
+        return count_lines(self.path)
+
+    @property
+    def checksum(self) -> Optional[str]:
+        """Hex digest of the compressed file, available once all data has been read.
+
+        Only computed if checksum_algorithm or expected_checksum were given.
+        """
+        return self._checksum_verifier.checksum if self._checksum_verifier else None
+
+    def _compressed_position(self) -> int:
+        if self._readahead is not None:
+            return self._readahead.compressed_position
+        return self._position()
+
+    def _update_progress_bar(self, *, force: bool = False) -> None:
+        if self._progress_bar is None:
+            return
+        now = monotonic()
+        if force or now >= self._progress_bar_next_update:
+            position = (
+                self._lines_read
+                if self._progress_bar_lines
+                else self._compressed_position()
+            )
+            self._progress_bar.update(position - self._progress_bar.n)
+            self._progress_bar_next_update = now + self._progress_bar_interval
+
+    def _close_decompressing(self) -> None:
+        stats = self.stats
+        if stats is not None and self._log_stats:
+            _LOGGER.info("Read '{}': {}", self._name, stats)
+        if self._progress_bar is not None:
+            self._update_progress_bar(force=True)
+        self._release_decompressing()
+
+    def _release_decompressing(self) -> None:
+        """Closes the progress bar, read-ahead thread, and streams.
+
+        Also used to clean up if opening the reader fails after they were set up.
+        """
+        if self._progress_bar is not None:
+            self._progress_bar.close()
+        if self._readahead is not None:
+            self._readahead.close()
+        for stream in self._streams:
+            stream.close()
+
+
+_T_DecompressingTextIOWrapperBase = TypeVar(
+    "_T_DecompressingTextIOWrapperBase", bound="_DecompressingTextIOWrapperBase"
+)
+
+
+class _DecompressingTextIOWrapperBase(_DecompressingReaderMixin, TextIOWrapper):
     @overrides
     def read(self, n: Optional[int] = -1) -> str:
+        if not self._track_reads:
+            return super().read(n)
+        start = perf_counter()
         result = super().read(n)
-        if self._progress_bar is not None:
-            self._progress_bar.update(self.tell() - self._progress_bar.n)
+        self._after_read(start, result.count("\n") if self._count_lines else 0)
         return result
 
     @overrides
     def readline(self, size: int = -1) -> str:
+        if not self._track_reads:
+            return super().readline(size)
+        start = perf_counter()
         result = super().readline(size)
-        if self._progress_bar is not None:
-            self._progress_bar.update(self.tell() - self._progress_bar.n)
+        self._after_read(start, 1 if result else 0)
         return result
 
+    @overrides
+    def __iter__(self) -> Iterator[str]:  # type: ignore[override]  # noqa: F821
+        # Iterating over TextIOWrapper of a subclass calls the overridden readline()
+        # for every line, so bypass it and only do the bookkeeping once per batch.
+        return self._iter_batched(super().readline, "")
+
     @overrides
     def tell(self) -> int:
         """Tells the number of compressed bytes that have already been read."""
-        return self._fp.tell()
+        return self._compressed_position()
+
+    @overrides
+    def close(self) -> None:
+        if not self.closed:
+            self._close_decompressing()
+        super().close()
 
     @overrides
-    def __enter__(self) -> "DecompressingTextIOWrapper":
-        return cast(DecompressingTextIOWrapper, super().__enter__())
+    def __enter__(
+        self: _T_DecompressingTextIOWrapperBase,
+    ) -> (_T_DecompressingTextIOWrapperBase):
+        return cast(_T_DecompressingTextIOWrapperBase, super().__enter__())
 
     # In the following the type-comment is used to have Mypy ignore that this method
     # definition does not match the supertype (no idea why that can be or to fix it).
@@ -115,8 +1120,697 @@ class DecompressingTextIOWrapper(TextIOWrapper):
         exc_value: Optional[BaseException],
         traceback: Optional[TracebackType],
     ) -> Optional[bool]:
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class DecompressingTextIOWrapper(_DecompressingTextIOWrapperBase):
+    """Text reader that transparently decompresses gzip, bzip2, xz, and zstd files.
+
+    The compression type is detected from the first bytes of the file, so that the
+    file extension does not matter. Instead of a path, any readable binary stream can
+    be given (e.g., sys.stdin.buffer or the stdout of a subprocess), which is closed
+    together with the reader. In that case, the progress bar has no total and path is
+    None.
+
+    If readahead is greater than zero, decompression is performed in a background
+    thread that buffers up to readahead chunks of readahead_chunk_size decompressed
+    bytes each.
+
+    The decompressor argument selects between the in-process codecs and external
+    decompressor binaries, see DecompressorBackend.
+
+    Zstandard files that were compressed with a dictionary are decompressed with
+    zstd_dict, or, if that is not given, with the matching dictionary found by
+    find_zstd_dict().
+
+    If checksum_algorithm (any name accepted by hashlib.new()) or expected_checksum
+    is given, the compressed bytes are hashed while they are read, so that no second
+    pass over the file is needed. Once all data has been read, the hex digest is
+    available as checksum. If it does not match expected_checksum (defaulting to
+    SHA-256), ChecksumMismatchError is raised by the read that reaches the end.
+
+    The progress bar is updated at most every progress_bar_interval seconds, both when
+    calling read()/readline() and when iterating over the lines of the file. If
+    progress_bar_lines is set, the progress bar shows lines instead of compressed
+    bytes, with the total number of lines obtained from count_lines() (which needs an
+    extra pass over the file, unless its result is cached).
+
+    If stats is set, throughput statistics are collected and available as stats (see
+    ReaderStats). If log_stats is set, they are additionally logged on closing.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, BinaryIO],
+        *,
+        encoding: str,
+        decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+        zstd_dict: Optional[ZstdCompressionDict] = None,
+        checksum_algorithm: Optional[str] = None,
+        expected_checksum: Optional[str] = None,
+        readahead: int = 0,
+        readahead_chunk_size: int = 2 ** 20,  # 1 MiB
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+        progress_bar_interval: float = 0.1,
+        progress_bar_lines: bool = False,
+        stats: bool = False,
+        log_stats: bool = False,
+    ):
+        fin = self._open_decompressing(
+            path,
+            decompressor=decompressor,
+            zstd_dict=zstd_dict,
+            checksum_algorithm=checksum_algorithm,
+            expected_checksum=expected_checksum,
+            readahead=readahead,
+            readahead_chunk_size=readahead_chunk_size,
+            warn_uncompressed=warn_uncompressed,
+            progress_bar=progress_bar,
+            progress_bar_desc=progress_bar_desc,
+            progress_bar_interval=progress_bar_interval,
+            progress_bar_lines=progress_bar_lines,
+            stats=stats,
+            log_stats=log_stats,
+        )
+        try:
+            super().__init__(fin, encoding=encoding)
+        except BaseException:
+            self._release_decompressing()
+            raise
+
+
+class MultiFileTextReader(_DecompressingTextIOWrapperBase):
+    """Reads several (compressed) files as one logical text stream.
+
+    Files are given as a sequence of paths or as a glob pattern (whose matches are
+    sorted) and are concatenated as they are, i.e., a file not ending in a newline
+    continues its last line into the next file.
+
+    Decompression happens in a background thread (see readahead in
+    DecompressingTextIOWrapper) which opens the next file as soon as the current one
+    is exhausted, so that there is no stall at file boundaries. Set readahead to zero
+    to disable this. The progress bar shows progress over the total compressed size
+    of all files.
+    """
+
+    def __init__(
+        self,
+        paths: Union[str, Iterable[Path]],
+        *,
+        encoding: str,
+        decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+        zstd_dict: Optional[ZstdCompressionDict] = None,
+        readahead: int = 4,
+        readahead_chunk_size: int = 2 ** 20,  # 1 MiB
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+        progress_bar_interval: float = 0.1,
+        progress_bar_lines: bool = False,
+        stats: bool = False,
+        log_stats: bool = False,
+    ):
+        if isinstance(paths, str):
+            self.paths: Sequence[Path] = [
+                Path(path) for path in sorted(glob(paths, recursive=True))
+            ]
+            if not self.paths:
+                raise FileNotFoundError(f"No files match pattern '{paths}'.")
+        else:
+            self.paths = list(paths)
+
+        self.path = None
+        self._name = f"{len(self.paths)} files"
+        self._checksum_verifier = None
+        reader = _ConcatenatingReader(
+            self.paths,
+            decompressor=decompressor,
+            zstd_dict=zstd_dict,
+            warn_uncompressed=warn_uncompressed,
+        )
+        fin = self._setup_decompressing(
+            cast(BinaryIO, reader),
+            streams=(cast(IO[bytes], reader),),
+            position=reader.compressed_position,
+            readahead=readahead,
+            readahead_chunk_size=readahead_chunk_size,
+            progress_bar=progress_bar,
+            progress_bar_desc=progress_bar_desc or f"{len(self.paths)} files",
+            progress_bar_interval=progress_bar_interval,
+            progress_bar_lines=progress_bar_lines,
+            stats=stats,
+            log_stats=log_stats,
+        )
+        try:
+            super().__init__(fin, encoding=encoding)
+        except BaseException:
+            self._release_decompressing()
+            raise
+
+    @overrides
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.paths)
+
+    @overrides
+    def num_lines(self) -> int:
+        return sum(count_lines(path) for path in self.paths)
+
+
+class DecompressingBinaryReader(_DecompressingReaderMixin, BufferedReader):
+    """Binary counterpart of DecompressingTextIOWrapper.
+
+    Returns the decompressed data as bytes without decoding it, either as lines (by
+    iterating or calling readline()), as blocks of fixed size (iter_blocks()), or
+    directly into caller-provided buffers (readinto()).
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, BinaryIO],
+        *,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+        zstd_dict: Optional[ZstdCompressionDict] = None,
+        checksum_algorithm: Optional[str] = None,
+        expected_checksum: Optional[str] = None,
+        readahead: int = 0,
+        readahead_chunk_size: int = 2 ** 20,  # 1 MiB
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+        progress_bar_interval: float = 0.1,
+        progress_bar_lines: bool = False,
+        stats: bool = False,
+        log_stats: bool = False,
+    ):
+        fin = self._open_decompressing(
+            path,
+            decompressor=decompressor,
+            zstd_dict=zstd_dict,
+            checksum_algorithm=checksum_algorithm,
+            expected_checksum=expected_checksum,
+            readahead=readahead,
+            readahead_chunk_size=readahead_chunk_size,
+            warn_uncompressed=warn_uncompressed,
+            progress_bar=progress_bar,
+            progress_bar_desc=progress_bar_desc,
+            progress_bar_interval=progress_bar_interval,
+            progress_bar_lines=progress_bar_lines,
+            stats=stats,
+            log_stats=log_stats,
+        )
+        try:
+            super().__init__(fin, buffer_size=buffer_size)  # type: ignore
+        except BaseException:
+            self._release_decompressing()
+            raise
+
+    @overrides
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if not self._track_reads:
+            return super().read(size)
+        start = perf_counter()
+        result = super().read(size)
+        self._after_read(start, result.count(b"\n") if self._count_lines else 0)
+        return result
+
+    @overrides
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        if not self._track_reads:
+            return super().readline(size)
+        start = perf_counter()
+        result = super().readline(size)
+        self._after_read(start, 1 if result else 0)
+        return result
+
+    @overrides
+    def readinto(self, b: bytearray) -> int:  # type: ignore[override]  # noqa: F821
+        if not self._track_reads:
+            return super().readinto(b)
+        start = perf_counter()
+        result = super().readinto(b)
+        self._after_read(
+            start,
+            memoryview(b)[:result].tobytes().count(b"\n") if self._count_lines else 0,
+        )
+        return result
+
+    @overrides
+    def __iter__(self) -> Iterator[bytes]:  # type: ignore[override]  # noqa: F821
+        # See DecompressingTextIOWrapper.__iter__().
+        return self._iter_batched(super().readline, b"")
+
+    def iter_blocks(self, block_size: int) -> Iterator[bytes]:
+        """Iterates over blocks of block_size bytes (except for the last block)."""
+        return iter(lambda: self.read(block_size), b"")
+
+    @overrides
+    def tell(self) -> int:
+        """Tells the number of compressed bytes that have already been read."""
+        return self._compressed_position()
+
+    @overrides
+    def close(self) -> None:
+        if not self.closed:
+            self._close_decompressing()
+        super().close()
+
+    @overrides
+    def __enter__(self) -> "DecompressingBinaryReader":
+        return cast(DecompressingBinaryReader, super().__enter__())
+
+    # See DecompressingTextIOWrapper.__exit__() for the reason of the comments.
+    @overrides
+    def __exit__(  # type: ignore[override]  # noqa: F821
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> Optional[bool]:
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class MemoryMappedLineReader:
+    """Zero-copy line reader for uncompressed files.
+
+    Iterating yields memoryviews into the memory-mapped file, so lines can be handed
+    to byte-oriented parsers without copying or decoding them. Use lines() to get
+    decoded lines instead. The memoryviews are only valid while the reader is open.
+    """
+
+    # Number of lines after which the progress bar is updated.
+    _PROGRESS_BAR_BATCH_SIZE = 1024
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+    ):
+        self.path = path
+        if detect_compression(path) is not None:
+            raise ValueError(
+                f"File '{path}' is compressed, use DecompressingTextIOWrapper instead."
+            )
+
+        self._fp = path.open("rb")
+        self._size = self.size()
+        self._mmap: Optional[mmap] = None
+        self._view = memoryview(b"")
+        # Mapping empty files is not possible.
+        if self._size:
+            self._mmap = mmap(self._fp.fileno(), 0, access=ACCESS_READ)
+            if MADV_SEQUENTIAL is not None:
+                self._mmap.madvise(MADV_SEQUENTIAL)
+            self._view = memoryview(self._mmap)
+        self._pos = 0
+
+        self._progress_bar: Optional[tqdm[None]] = None
+        if progress_bar:
+            self._progress_bar = tqdm(
+                desc=progress_bar_desc or self.path.name,
+                total=self._size,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                dynamic_ncols=True,
+            )
+
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __iter__(self) -> Iterator[memoryview]:
+        if self._mmap is None:
+            return
+        find = self._mmap.find
+        lines_since_update = 0
+        while self._pos < self._size:
+            end = find(b"\n", self._pos)
+            end = self._size if end == -1 else end + 1
+            line = self._view[self._pos : end]
+            self._pos = end
+
+            lines_since_update += 1
+            if (
+                self._progress_bar is not None
+                and lines_since_update >= self._PROGRESS_BAR_BATCH_SIZE
+            ):
+                self._progress_bar.update(self._pos - self._progress_bar.n)
+                lines_since_update = 0
+
+            yield line
+
+        if self._progress_bar is not None:
+            self._progress_bar.update(self._pos - self._progress_bar.n)
+
+    def lines(self, *, encoding: str) -> Iterator[str]:
+        """Iterates over lines, decoding each one only when it is requested."""
+        for line in self:
+            yield str(line, encoding)
+
+    def close(self) -> None:
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Some yielded lines are still referenced, the mapping will be closed
+                # once they are garbage collected.
+                pass
+        self._fp.close()
+        if self._progress_bar is not None:
+            self._progress_bar.close()
+
+    def __enter__(self) -> "MemoryMappedLineReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+class CompressingTextIOWrapper(TextIOWrapper):
+    """Text writer that compresses its output based on the file extension.
+
+    Zstandard compression uses multiple threads by default (see the threads-argument
+    of ZstdCompressor). If compression_level is None, each codec's default is used.
+    If frame_size is given, Zstandard output is written in the seekable format with
+    frames of (at least) frame_size uncompressed bytes each. If zstd_dict is given,
+    Zstandard output is compressed with that dictionary (see train_zstd_dict()).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        encoding: str,
+        compression_level: Optional[int] = None,
+        threads: int = -1,
+        frame_size: Optional[int] = None,
+        zstd_dict: Optional[ZstdCompressionDict] = None,
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+    ):
+        self.path = path
+
+        self.compression = Compression.from_suffix(path)
+
+        if self.compression is None and warn_uncompressed:  # pragma: no cover
+            _LOGGER.warning(
+                "Could not detect compression type of file '{}' from its "
+                "extension, writing as uncompressed file.",
+                path,
+            )
+
+        self._fp = path.open("wb")
+        self._fout = compressing_writer(
+            self._fp,
+            self.compression,
+            compression_level=compression_level,
+            threads=threads,
+            frame_size=frame_size,
+            zstd_dict=zstd_dict,
+        )
+
+        self._progress_bar: Optional[tqdm[None]] = None
+        if progress_bar:
+            self._progress_bar = tqdm(
+                desc=progress_bar_desc or self.path.name,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                dynamic_ncols=True,
+            )
+
+        super().__init__(self._fout, encoding=encoding)
+
+    @overrides
+    def write(self, s: str) -> int:
+        result = super().write(s)
+        if self._progress_bar is not None:
+            self._progress_bar.update(self.tell() - self._progress_bar.n)
+        return result
+
+    @overrides
+    def tell(self) -> int:
+        """Tells the number of compressed bytes that have already been written."""
+        return self._fp.tell()
+
+    @overrides
+    def __enter__(self) -> "CompressingTextIOWrapper":
+        return cast(CompressingTextIOWrapper, super().__enter__())
+
+    @overrides
+    def close(self) -> None:
+        if self.closed:
+            return
+        # Closing order is reversed compared to reading: the compressor needs to write
+        # its trailing data into self._fp before that one can be closed.
+        super().close()
+        self._fout.close()
         self._fp.close()
-        self._fin.close()
         if self._progress_bar is not None:
+            self._progress_bar.update(self.path.stat().st_size - self._progress_bar.n)
             self._progress_bar.close()
+
+    # See DecompressingTextIOWrapper.__exit__() for the reason of the comments.
+    @overrides
+    def __exit__(  # type: ignore[override]  # noqa: F821
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> Optional[bool]:
         return super().__exit__(exc_type, exc_value, traceback)
+
+
+@dataclass
+class _Shard:
+    path: Path
+    tmp_path: Path
+    date: Optional[date]
+    num_records: int = 0
+    num_bytes: int = 0
+    fp: Optional[BinaryIO] = None
+    fout: Optional[BinaryIO] = None
+
+
+class ShardedCompressingWriter:
+    """Writes records to a sequence of compressed files (shards).
+
+    A new shard is started once the current one holds max_records records or at
+    least max_bytes uncompressed bytes, or when a record with a different date (see
+    write()) arrives. Shard paths are created from path_template, which may contain
+    the same placeholders as the filename of DynamicFileHandler as well as {index}
+    (the number of the shard, starting at 0) and {date} (the date of its records). The
+    compression of each shard is chosen based on the extension of its path, just as
+    for CompressingTextIOWrapper.
+
+    Each shard is written to a temporary file next to it and only renamed to its
+    final path once it is complete, so that readers never see partial shards. If the
+    writer is used as a context manager and an exception is raised, the current shard
+    is discarded instead. Compressing and writing happens in a background thread,
+    which allows producing records for the next shard while the previous one is still
+    being compressed and finalized. At most max_pending_chunks chunks of chunk_size
+    bytes are buffered for the background thread.
+    """
+
+    def __init__(
+        self,
+        path_template: Union[str, Path],
+        *,
+        encoding: str,
+        max_bytes: Optional[int] = None,
+        max_records: Optional[int] = None,
+        compression_level: Optional[int] = None,
+        threads: int = -1,
+        frame_size: Optional[int] = None,
+        zstd_dict: Optional[ZstdCompressionDict] = None,
+        chunk_size: int = 2 ** 20,  # 1 MiB
+        max_pending_chunks: int = 16,
+        warn_uncompressed: bool = True,
+    ):
+        self.path_template = str(path_template)
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.paths: MutableSequence[Path] = []
+
+        self._compression_level = compression_level
+        self._threads = threads
+        self._frame_size = frame_size
+        self._zstd_dict = zstd_dict
+        self._chunk_size = chunk_size
+        self._max_pending_chunks = max_pending_chunks
+        self._warn_uncompressed = warn_uncompressed
+        self._filename_args = dynamic_filename_args()
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending: Deque[Future[None]] = deque()
+        self._shard: Optional[_Shard] = None
+        self._chunk: MutableSequence[bytes] = []
+        self._chunk_bytes = 0
+        self._closed = False
+
+    def write(self, record: str, *, date: Optional[date] = None) -> None:
+        """Writes record as a single line, a newline is appended if it is missing.
+
+        If date is given and differs from the date of the current shard, a new shard
+        is started.
+        """
+        if self._closed:
+            raise ValueError("I/O operation on closed writer.")
+        if not record.endswith("\n"):
+            record += "\n"
+
+        shard = self._shard
+        if shard is not None and (
+            (date is not None and date != shard.date)
+            or (self.max_records is not None and shard.num_records >= self.max_records)
+            or (self.max_bytes is not None and shard.num_bytes >= self.max_bytes)
+        ):
+            self._finish_shard()
+            shard = None
+        if shard is None:
+            shard = self._start_shard(date)
+
+        data = record.encode(self.encoding)
+        shard.num_records += 1
+        shard.num_bytes += len(data)
+        self._chunk.append(data)
+        self._chunk_bytes += len(data)
+        if self._chunk_bytes >= self._chunk_size:
+            self._flush_chunk()
+
+    def _start_shard(self, date_: Optional[date]) -> _Shard:
+        path = Path(
+            self.path_template.format(
+                index=len(self.paths), date=date_, **self._filename_args
+            )
+        )
+        if path in self.paths:
+            raise ValueError(
+                f"Path template '{self.path_template}' resulted in path '{path}' for "
+                "more than one shard. Include {index} or {date} in the template."
+            )
+        self.paths.append(path)
+        self._shard = _Shard(
+            path=path, tmp_path=path.with_name(path.name + ".tmp"), date=date_
+        )
+        self._submit(self._open_shard, self._shard)
+        return self._shard
+
+    def _finish_shard(self) -> None:
+        self._flush_chunk()
+        self._submit(self._close_shard, cast(_Shard, self._shard))
+        self._shard = None
+
+    def _flush_chunk(self) -> None:
+        if self._chunk:
+            self._submit(self._write_chunk, cast(_Shard, self._shard), self._chunk)
+            self._chunk = []
+            self._chunk_bytes = 0
+
+    def _submit(self, fn: Callable[..., None], *args: object) -> None:
+        self._pending.append(self._executor.submit(fn, *args))
+        while self._pending and (
+            self._pending[0].done() or len(self._pending) > self._max_pending_chunks
+        ):
+            # Raises exceptions that occurred in the background thread.
+            self._pending.popleft().result()
+
+    # The following are executed in the background thread.
+
+    def _open_shard(self, shard: _Shard) -> None:
+        compression = Compression.from_suffix(shard.path)
+        if compression is None and self._warn_uncompressed:  # pragma: no cover
+            _LOGGER.warning(
+                "Could not detect compression type of file '{}' from its "
+                "extension, writing as uncompressed file.",
+                shard.path,
+            )
+        shard.path.parent.mkdir(parents=True, exist_ok=True)
+        shard.fp = shard.tmp_path.open("wb")
+        shard.fout = compressing_writer(
+            shard.fp,
+            compression,
+            compression_level=self._compression_level,
+            threads=self._threads,
+            frame_size=self._frame_size,
+            zstd_dict=self._zstd_dict,
+        )
+
+    def _write_chunk(self, shard: _Shard, chunk: Sequence[bytes]) -> None:
+        cast(BinaryIO, shard.fout).write(b"".join(chunk))
+
+    def _close_shard(self, shard: _Shard) -> None:
+        cast(BinaryIO, shard.fout).close()
+        cast(BinaryIO, shard.fp).close()
+        shard.tmp_path.replace(shard.path)
+        _LOGGER.debug(
+            "Wrote shard '{}' with {} records.", shard.path, shard.num_records
+        )
+
+    def _discard_shard(self, shard: _Shard) -> None:
+        try:
+            if shard.fout is not None:
+                shard.fout.close()
+        finally:
+            if shard.fp is not None:
+                shard.fp.close()
+            if shard.tmp_path.exists():
+                shard.tmp_path.unlink()
+        _LOGGER.debug("Discarded incomplete shard '{}'.", shard.path)
+
+    def close(self) -> None:
+        """Finishes the current shard and waits until all shards are written."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._shard is not None:
+                self._finish_shard()
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown()
+
+    def _abort(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._shard is not None:
+            self.paths.remove(self._shard.path)
+            # Submitted directly, so that errors of earlier background tasks do not
+            # prevent the shard from being discarded.
+            self._executor.submit(self._discard_shard, self._shard)
+            self._shard = None
+        self._chunk = []
+        self._chunk_bytes = 0
+        self._executor.shutdown()
+        self._pending.clear()
+
+    def __enter__(self) -> "ShardedCompressingWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
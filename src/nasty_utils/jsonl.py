@@ -0,0 +1,220 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import deque
+from concurrent.futures import Executor, Future
+from importlib import import_module
+from itertools import islice
+from logging import getLogger
+from pathlib import Path
+from types import TracebackType
+from typing import (
+    Callable,
+    Deque,
+    Iterator,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from nasty_utils.io_ import DecompressingBinaryReader
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+# In order of preference. All of them can parse bytes directly.
+JSON_BACKENDS = ("orjson", "ujson", "simdjson", "json")
+
+_LOADS_CACHE: MutableMapping[str, Callable[[bytes], object]] = {}
+
+
+def json_loads_function(backend: Optional[str] = None) -> Callable[[bytes], object]:
+    """Returns the loads() function of the given JSON backend.
+
+    If backend is None, the first installed one of JSON_BACKENDS is used.
+    """
+    return _LOADS_CACHE[find_json_backend(backend)]
+
+
+def find_json_backend(backend: Optional[str] = None) -> str:
+    for name in (backend,) if backend else JSON_BACKENDS:
+        if name in _LOADS_CACHE:
+            return name
+        if name not in JSON_BACKENDS:
+            raise ValueError(f"Unknown JSON backend '{name}'.")
+        try:
+            module = import_module(name)
+        except ImportError:
+            if backend:
+                raise
+            continue
+        _LOADS_CACHE[name] = module.loads  # type: ignore
+        return name
+    raise AssertionError("Module 'json' is always available.")  # pragma: no cover
+
+
+def lookup_field(record: object, field: Union[str, Sequence[str]]) -> object:
+    """Returns the value of a (nested) field of a parsed JSON record.
+
+    Nested fields are given by separating keys with dots, e.g., "user.id", or as a
+    sequence of keys (to avoid splitting them for every record). Returns None if the
+    field is missing or one of its parents is not an object.
+    """
+    for key in field.split(".") if isinstance(field, str) else field:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def _parse_lines(
+    lines: Sequence[bytes], backend: str, skip_malformed: bool
+) -> Tuple[Sequence[object], int]:
+    """Parses a batch of lines, returns the records and number of malformed lines."""
+    loads = json_loads_function(backend)
+    records = []
+    num_malformed = 0
+    for line in lines:
+        if line.isspace():
+            continue
+        try:
+            records.append(loads(line))
+        except ValueError:
+            if not skip_malformed:
+                raise
+            num_malformed += 1
+    return records, num_malformed
+
+
+class JsonlReader:
+    """Reads records from a (compressed) file of JSON lines.
+
+    Lines are parsed from bytes with the fastest installed JSON backend, unless one is
+    requested explicitly. Empty lines are ignored. Malformed lines raise a ValueError,
+    unless skip_malformed is set, in which case they are only counted.
+
+    If an executor is given, batches of parse_batch_size lines are parsed in it while
+    the next lines are read. Records are still returned in order. Use a
+    ProcessPoolExecutor for pure-Python backends such as json, since those hold the
+    GIL while parsing.
+
+    If checksum_algorithm is given, the compressed file is hashed while reading it,
+    see DecompressingTextIOWrapper.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        json_backend: Optional[str] = None,
+        skip_malformed: bool = False,
+        executor: Optional[Executor] = None,
+        parse_batch_size: int = 1024,
+        max_pending_batches: int = 16,
+        readahead: int = 0,
+        checksum_algorithm: Optional[str] = None,
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+    ):
+        self.path = path
+        self.json_backend = find_json_backend(json_backend)
+        self.skip_malformed = skip_malformed
+        self.num_records = 0
+        self.num_malformed = 0
+
+        self._executor = executor
+        self._parse_batch_size = parse_batch_size
+        self._max_pending_batches = max_pending_batches
+        self._fin = DecompressingBinaryReader(
+            path,
+            checksum_algorithm=checksum_algorithm,
+            readahead=readahead,
+            warn_uncompressed=warn_uncompressed,
+            progress_bar=progress_bar,
+            progress_bar_desc=progress_bar_desc,
+        )
+
+    def _iter_line_batches(self) -> Iterator[Sequence[bytes]]:
+        lines = iter(self._fin)
+        while True:
+            batch = list(islice(lines, self._parse_batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _iter_parsed_batches(self) -> Iterator[Tuple[Sequence[object], int]]:
+        if self._executor is None:
+            for batch in self._iter_line_batches():
+                yield _parse_lines(batch, self.json_backend, self.skip_malformed)
+            return
+
+        pending: Deque[Future[Tuple[Sequence[object], int]]] = deque()
+        for batch in self._iter_line_batches():
+            pending.append(
+                self._executor.submit(
+                    _parse_lines, batch, self.json_backend, self.skip_malformed
+                )
+            )
+            if len(pending) >= self._max_pending_batches:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def __iter__(self) -> Iterator[object]:
+        for records, num_malformed in self._iter_parsed_batches():
+            self.num_records += len(records)
+            self.num_malformed += num_malformed
+            yield from records
+
+    def iter_batches(self, batch_size: int) -> Iterator[Sequence[object]]:
+        """Iterates over lists of batch_size records (except for the last one)."""
+        records = iter(self)
+        while True:
+            batch: MutableSequence[object] = list(islice(records, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    @property
+    def checksum(self) -> Optional[str]:
+        """Hex digest of the file if checksum_algorithm was given, once it is read."""
+        return self._fin.checksum
+
+    def close(self) -> None:
+        if self.num_malformed:
+            _LOGGER.warning(
+                "Skipped {} malformed out of {} non-empty lines in file '{}'.",
+                self.num_malformed,
+                self.num_records + self.num_malformed,
+                self.path,
+            )
+        self._fin.close()
+
+    def __enter__(self) -> "JsonlReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
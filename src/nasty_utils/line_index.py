@@ -0,0 +1,539 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bz2
+import json
+import lzma
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from io import BufferedReader
+from logging import getLogger
+from pathlib import Path
+from types import TracebackType
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Deque,
+    Iterator,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from zstandard import ZstdCompressionDict, ZstdDecompressor
+
+from nasty_utils._util.io_ import decompressing_reader, zstd_dict_for
+from nasty_utils.io_ import Compression, detect_compression
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_MAGIC = b"NULIDX01"
+_HEADER = struct.Struct("<8sQqQQ")
+_CHUNK_SIZE = 2 ** 20  # 1 MiB
+
+
+# All of these objects provide decompress(), eof, and unused_data. Factories are
+# passed the Zstandard dictionary of the file (if any).
+_DECOMPRESSOR_FACTORIES: Mapping[
+    Compression, Callable[[Optional[ZstdCompressionDict]], Any]
+] = {
+    Compression.GZIP: lambda _: zlib.decompressobj(wbits=31),
+    Compression.BZIP2: lambda _: bz2.BZ2Decompressor(),
+    Compression.XZ: lambda _: lzma.LZMADecompressor(format=lzma.FORMAT_XZ),
+    Compression.ZSTD: lambda zstd_dict: ZstdDecompressor(
+        dict_data=zstd_dict
+    ).decompressobj(),
+}
+
+
+def _find_zstd_dict(
+    path: Path, compression: Optional[Compression]
+) -> Optional[ZstdCompressionDict]:
+    if compression != Compression.ZSTD:
+        return None
+    with path.open("rb") as fin:
+        return zstd_dict_for(path, fin)
+
+
+def _iter_blocks(
+    fin: BinaryIO,
+    compression: Optional[Compression],
+    *,
+    chunk_size: int,
+    zstd_dict: Optional[ZstdCompressionDict] = None,
+) -> Iterator[Tuple[Optional[int], bytes]]:
+    """Iterates over the decompressed contents of a file.
+
+    Yields tuples of the compressed offset at which decompression could be restarted
+    (or None if it can not be restarted before this data) and decompressed data.
+
+    Restarting is possible at the beginning of every gzip member, bzip2 stream, xz
+    stream, and Zstandard frame. For uncompressed files, it is possible everywhere.
+    """
+    if compression is None:
+        offset = 0
+        for data in iter(lambda: fin.read(chunk_size), b""):
+            yield offset, data
+            offset += len(data)
+        return
+
+    offset = 0
+    data = fin.read(chunk_size)
+    while data:
+        restart: Optional[int] = offset
+        decompressor = _DECOMPRESSOR_FACTORIES[compression](zstd_dict)
+        while not decompressor.eof:
+            if not data:
+                data = fin.read(chunk_size)
+                if not data:
+                    raise EOFError(f"Compressed file ended prematurely: {fin}")
+            decompressed = decompressor.decompress(data)
+            offset += len(data) - len(decompressor.unused_data)
+            yield restart, decompressed
+            restart = None
+            data = decompressor.unused_data if decompressor.eof else b""
+        data = data or fin.read(chunk_size)
+
+
+@dataclass
+class LineIndex:
+    """Index of restart points in a (compressed) file for accessing lines randomly.
+
+    For every restart point stores its compressed and decompressed offset, the number
+    of lines that ended before it, and whether it is located at the start of a line.
+    """
+
+    source_size: int
+    source_mtime_ns: int
+    num_lines: int
+    compressed_offsets: "array[int]"
+    decompressed_offsets: "array[int]"
+    lines_before: "array[int]"
+    aligned: "array[int]"
+
+    @classmethod
+    def sidecar_path(cls, path: Path) -> Path:
+        return path.with_name(path.name + ".lineidx")
+
+    @classmethod
+    def build(cls, path: Path, *, restart_interval: int = 2 ** 20) -> "LineIndex":
+        """Builds the index by decompressing the file once.
+
+        Restart points are only recorded if they are at least restart_interval
+        decompressed bytes apart, to keep the index small.
+        """
+        _LOGGER.debug("Building line index for file '{}'...", path)
+
+        stat = path.stat()
+        index = cls(
+            source_size=stat.st_size,
+            source_mtime_ns=stat.st_mtime_ns,
+            num_lines=0,
+            compressed_offsets=array("Q"),
+            decompressed_offsets=array("Q"),
+            lines_before=array("Q"),
+            aligned=array("B"),
+        )
+
+        compression = detect_compression(path)
+        decompressed_offset = 0
+        last_restart = -restart_interval
+        at_line_start = True
+        with path.open("rb") as fin:
+            for restart, data in _iter_blocks(
+                fin,
+                compression,
+                chunk_size=min(restart_interval, _CHUNK_SIZE),
+                zstd_dict=_find_zstd_dict(path, compression),
+            ):
+                if (
+                    restart is not None
+                    and decompressed_offset - last_restart >= restart_interval
+                ):
+                    index.compressed_offsets.append(restart)
+                    index.decompressed_offsets.append(decompressed_offset)
+                    index.lines_before.append(index.num_lines)
+                    index.aligned.append(at_line_start)
+                    last_restart = decompressed_offset
+                if data:
+                    index.num_lines += data.count(b"\n")
+                    decompressed_offset += len(data)
+                    at_line_start = data.endswith(b"\n")
+
+        if not index.compressed_offsets:
+            # Empty files have no blocks, but reading can always start at offset 0.
+            index.compressed_offsets.append(0)
+            index.decompressed_offsets.append(0)
+            index.lines_before.append(0)
+            index.aligned.append(True)
+
+        if not at_line_start:
+            index.num_lines += 1
+        return index
+
+    @classmethod
+    def load(cls, index_path: Path) -> "LineIndex":
+        with index_path.open("rb") as fin:
+            (
+                magic,
+                source_size,
+                source_mtime_ns,
+                num_lines,
+                num_restarts,
+            ) = _HEADER.unpack(fin.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"File '{index_path}' is not a line index.")
+
+            arrays: MutableSequence["array[int]"] = []
+            for typecode in "QQQB":
+                arr = array(typecode)
+                arr.fromfile(fin, num_restarts)
+                if sys.byteorder == "big":
+                    arr.byteswap()
+                arrays.append(arr)
+
+        return cls(
+            source_size=source_size,
+            source_mtime_ns=source_mtime_ns,
+            num_lines=num_lines,
+            compressed_offsets=arrays[0],
+            decompressed_offsets=arrays[1],
+            lines_before=arrays[2],
+            aligned=arrays[3],
+        )
+
+    @classmethod
+    def load_or_build(cls, path: Path, *, save: bool = True) -> "LineIndex":
+        """Loads the index from the sidecar file of path, or builds it if needed."""
+        index_path = cls.sidecar_path(path)
+        if index_path.exists():
+            index = cls.load(index_path)
+            if index.is_valid_for(path):
+                return index
+            _LOGGER.debug("Line index '{}' is outdated.", index_path)
+
+        index = cls.build(path)
+        if save:
+            index.save(index_path)
+        return index
+
+    def save(self, index_path: Path) -> None:
+        with index_path.open("wb") as fout:
+            fout.write(
+                _HEADER.pack(
+                    _MAGIC,
+                    self.source_size,
+                    self.source_mtime_ns,
+                    self.num_lines,
+                    len(self.compressed_offsets),
+                )
+            )
+            for arr in (
+                self.compressed_offsets,
+                self.decompressed_offsets,
+                self.lines_before,
+                self.aligned,
+            ):
+                if sys.byteorder == "big":
+                    arr = array(arr.typecode, arr)
+                    arr.byteswap()
+                arr.tofile(fout)
+
+    def is_valid_for(self, path: Path) -> bool:
+        stat = path.stat()
+        return (
+            self.source_size == stat.st_size
+            and self.source_mtime_ns == stat.st_mtime_ns
+        )
+
+    def first_line(self, restart: int) -> int:
+        """Returns the number of the first line that starts after a restart point."""
+        return self.lines_before[restart] + (0 if self.aligned[restart] else 1)
+
+    def restart_for_line(self, line: int) -> int:
+        """Returns the last restart point from which the given line can be read."""
+        restart = bisect_right(self.lines_before, line) - 1
+        while restart > 0 and self.first_line(restart) > line:
+            restart -= 1
+        return max(restart, 0)
+
+
+class IndexedLineReader:
+    """Reader for (compressed) files that allows jumping to arbitrary lines.
+
+    Only the data from the closest restart point of the given LineIndex on is
+    decompressed. Lines are split on b"\\n" only, consistent with the index.
+    """
+
+    def __init__(self, path: Path, *, encoding: str, index: Optional[LineIndex] = None):
+        self.path = path
+        self.encoding = encoding
+        self.index = index or LineIndex.load_or_build(path)
+        self.compression = detect_compression(path)
+        self._zstd_dict = _find_zstd_dict(path, self.compression)
+
+        self._fp: Optional[BinaryIO] = None
+        self._fin: Optional[BufferedReader] = None
+        self._line = 0
+        self.seek_line(0)
+
+    def tell_line(self) -> int:
+        return self._line
+
+    def seek_line(self, line: int) -> None:
+        if not 0 <= line <= self.index.num_lines:
+            raise ValueError(f"Line {line} is out of range for file '{self.path}'.")
+
+        restart = self.index.restart_for_line(line)
+        if self._fin is None or not (
+            self.index.first_line(restart) <= self._line <= line
+        ):
+            self._close_streams()
+            self._fp = self.path.open("rb")
+            self._fp.seek(self.index.compressed_offsets[restart])
+            self._fin = BufferedReader(  # type: ignore
+                decompressing_reader(self._fp, self.compression, self._zstd_dict)
+            )
+            if not self.index.aligned[restart]:
+                # Skip remainder of line that started before the restart point.
+                self._fin.readline()
+            self._line = self.index.first_line(restart)
+
+        while self._line < line:
+            self._fin.readline()
+            self._line += 1
+
+    def readline(self) -> str:
+        if self._fin is None:
+            raise ValueError("I/O operation on closed reader.")
+        result = self._fin.readline()
+        if result:
+            self._line += 1
+        return result.decode(self.encoding)
+
+    def read_range(self, start: int, stop: int) -> Sequence[str]:
+        """Reads lines start (inclusive) to stop (exclusive)."""
+        self.seek_line(start)
+        return [self.readline() for _ in range(min(stop, self.index.num_lines) - start)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.readline, "")
+
+    def _close_streams(self) -> None:
+        if self._fin is not None:
+            self._fin.close()
+            self._fin = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def close(self) -> None:
+        self._close_streams()
+
+    def __enter__(self) -> "IndexedLineReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+@dataclass
+class ReadCheckpoint:
+    """Position in a (compressed) file from which ResumableLineReader can resume.
+
+    Consists of the compressed offset of a restart point (see _iter_blocks()), whether
+    that restart point is located at the start of a line, and the number of lines to
+    skip after it to arrive at the next line to read. The size and modification time
+    of the file are recorded to detect if it changed.
+    """
+
+    line: int
+    compressed_offset: int
+    aligned: bool
+    skip_lines: int
+    source_size: int
+    source_mtime_ns: int
+
+    def to_token(self) -> str:
+        """Serializes the checkpoint into a string, e.g., for storing it in a file."""
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_token(cls, token: str) -> "ReadCheckpoint":
+        return cls(**json.loads(token))
+
+
+class ResumableLineReader:
+    """Line reader for (compressed) files that can resume reading at a checkpoint.
+
+    The checkpoint() method returns a ReadCheckpoint for the position after the last
+    line returned. Passing it to a new reader (e.g., after a crash) continues with the
+    next line. Decompression then restarts at the last gzip member, bzip2 stream, xz
+    stream, or Zstandard frame that started before that line, so resuming is fast for
+    files with many of those (e.g., those written with frame_size). For files with only
+    a single one, all lines before the checkpoint are decompressed and skipped again.
+
+    Lines are split on b"\\n" only, consistent with LineIndex.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        encoding: str,
+        checkpoint: Optional[ReadCheckpoint] = None,
+        chunk_size: int = _CHUNK_SIZE,
+    ):
+        self.path = path
+        self.encoding = encoding
+        self.compression = detect_compression(path)
+        self._zstd_dict = _find_zstd_dict(path, self.compression)
+
+        stat = path.stat()
+        if checkpoint is None:
+            checkpoint = ReadCheckpoint(
+                line=0,
+                compressed_offset=0,
+                aligned=True,
+                skip_lines=0,
+                source_size=stat.st_size,
+                source_mtime_ns=stat.st_mtime_ns,
+            )
+        elif (
+            checkpoint.source_size != stat.st_size
+            or checkpoint.source_mtime_ns != stat.st_mtime_ns
+        ):
+            raise ValueError(
+                f"File '{path}' has changed since the checkpoint was taken."
+            )
+
+        self._checkpoint = checkpoint
+        self._line = checkpoint.line
+        # Offset after the last line, only used for uncompressed files.
+        self._position = checkpoint.compressed_offset
+        # Tuples of compressed offset, whether at line start, and first line number.
+        self._restarts: Deque[Tuple[int, bool, int]] = deque()
+        self._fin = path.open("rb")
+        self._fin.seek(checkpoint.compressed_offset)
+        self._lines = self._iter_lines(checkpoint, chunk_size)
+
+    def _iter_lines(self, checkpoint: ReadCheckpoint, chunk_size: int) -> Iterator[str]:
+        start_line = checkpoint.line
+        at_line_start = checkpoint.aligned
+        # Number of lines that ended before the current position.
+        num_lines = start_line - checkpoint.skip_lines - (0 if at_line_start else 1)
+        partial = b""
+        for restart, data in _iter_blocks(
+            self._fin,
+            self.compression,
+            chunk_size=chunk_size,
+            zstd_dict=self._zstd_dict,
+        ):
+            if restart is not None:
+                self._restarts.append(
+                    (
+                        checkpoint.compressed_offset + restart,
+                        at_line_start,
+                        num_lines + (0 if at_line_start else 1),
+                    )
+                )
+                self._prune_restarts()
+            if not data:
+                continue
+
+            lines = (partial + data).split(b"\n")
+            partial = lines.pop()
+            for line in lines:
+                num_lines += 1
+                self._position += len(line) + 1
+                if num_lines > start_line:
+                    self._line = num_lines
+                    yield (line + b"\n").decode(self.encoding)
+            at_line_start = not partial
+
+        if partial and num_lines >= start_line:
+            self._line = num_lines + 1
+            self._position += len(partial)
+            yield partial.decode(self.encoding)
+
+    def _prune_restarts(self) -> None:
+        """Drops restart points that are superseded by later ones for the next line."""
+        while len(self._restarts) > 1 and self._restarts[1][2] <= self._line:
+            self._restarts.popleft()
+
+    def tell_line(self) -> int:
+        return self._line
+
+    def checkpoint(self) -> ReadCheckpoint:
+        """Returns a checkpoint for resuming reading with the next line."""
+        if self.compression is None:
+            # Every offset is a restart point.
+            return replace(
+                self._checkpoint,
+                line=self._line,
+                compressed_offset=self._position,
+                aligned=True,
+                skip_lines=0,
+            )
+        self._prune_restarts()
+        if not self._restarts:
+            # Nothing has been decompressed yet.
+            return self._checkpoint
+        compressed_offset, aligned, first_line = self._restarts[0]
+        return replace(
+            self._checkpoint,
+            line=self._line,
+            compressed_offset=compressed_offset,
+            aligned=aligned,
+            skip_lines=self._line - first_line,
+        )
+
+    def readline(self) -> str:
+        if self._fin.closed:
+            raise ValueError("I/O operation on closed reader.")
+        return next(self._lines, "")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.readline, "")
+
+    def close(self) -> None:
+        self._fin.close()
+
+    def __enter__(self) -> "ResumableLineReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
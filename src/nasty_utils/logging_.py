@@ -15,11 +15,9 @@
 #
 
 import string
-from datetime import datetime
 from inspect import getfile
 from logging import DEBUG, FileHandler, Logger, LoggerAdapter, LogRecord, StreamHandler
 from pathlib import Path
-from sys import argv
 from typing import (
     Any,
     Mapping,
@@ -35,7 +33,8 @@ from typing import (
 from colorlog import ColoredFormatter, escape_codes
 from overrides import overrides
 from tqdm import tqdm
-from xdg import XDG_DATA_HOME
+
+from nasty_utils._util.logging_ import dynamic_filename_args
 
 
 class _ColoredStringFormatter(string.Formatter):
@@ -180,13 +179,7 @@ class DynamicFileHandler(FileHandler):
         delay: bool = False,
         symlink: Union[None, str, Path] = None,
     ):
-        now = datetime.now()
-        filename_args = {
-            "asctime": now,
-            "msecs": now.microsecond / 1000,
-            "argv0": Path(argv[0]).name,
-            "XDG_DATA_HOME": XDG_DATA_HOME,
-        }
+        filename_args = dynamic_filename_args()
         parsed_filename = Path(str(filename).format(**filename_args))
         parsed_filename.parent.mkdir(parents=True, exist_ok=True)
 
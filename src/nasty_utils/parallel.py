@@ -0,0 +1,681 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from io import StringIO
+from itertools import islice
+from logging import getLogger
+from os import cpu_count
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import (
+    Callable,
+    Deque,
+    Generic,
+    Iterable,
+    Iterator,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from tqdm import tqdm
+
+from nasty_utils._util.io_ import zstd_dict_for
+from nasty_utils.io_ import (
+    Compression,
+    DecompressingTextIOWrapper,
+    DecompressorBackend,
+    ReaderStats,
+    detect_compression,
+)
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+from nasty_utils.seekable_zstd import ZstdFrame, read_seek_table
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_T = TypeVar("_T")
+
+
+@dataclass
+class _ShardResult(Generic[_T]):
+    # Bytes before the first newline in the shard (including the newline). These
+    # complete the last line of the previous shard.
+    head: bytes
+    # Bytes after the last newline in the shard, or None if the shard does not contain
+    # a newline at all.
+    tail: Optional[bytes]
+    results: Sequence[_T]
+    compressed_size: int
+
+
+def _identity(line: str) -> str:
+    return line
+
+
+def _split_lines(data: bytes, encoding: str) -> Sequence[str]:
+    # Use universal newlines just like TextIOWrapper does.
+    return list(StringIO(data.decode(encoding), newline=None))
+
+
+def _process_shard(
+    path: Path, frames: Sequence[ZstdFrame], encoding: str, fn: Callable[[str], _T]
+) -> _ShardResult[_T]:
+    with path.open("rb") as fin:
+        zstd_dict = zstd_dict_for(path, fin)
+        data = b"".join(frame.decompress(fin, zstd_dict) for frame in frames)
+    compressed_size = sum(frame.compressed_size for frame in frames)
+
+    first_newline = data.find(b"\n")
+    if first_newline == -1:
+        return _ShardResult(
+            head=data, tail=None, results=[], compressed_size=compressed_size
+        )
+
+    last_newline = data.rfind(b"\n")
+    return _ShardResult(
+        head=data[: first_newline + 1],
+        tail=data[last_newline + 1 :],
+        results=[
+            fn(line)
+            for line in _split_lines(
+                data[first_newline + 1 : last_newline + 1], encoding
+            )
+        ],
+        compressed_size=compressed_size,
+    )
+
+
+def _group_frames(
+    frames: Sequence[ZstdFrame], shard_size: int
+) -> Sequence[Sequence[ZstdFrame]]:
+    shards: MutableSequence[MutableSequence[ZstdFrame]] = [[]]
+    current_size = 0
+    for frame in frames:
+        if current_size >= shard_size:
+            shards.append([])
+            current_size = 0
+        shards[-1].append(frame)
+        current_size += frame.compressed_size
+    return shards
+
+
+def _stitch_shard(
+    carry: bytes, shard: _ShardResult[_T], encoding: str, fn: Callable[[str], _T]
+) -> Tuple[Sequence[_T], bytes]:
+    """Joins the tail of the previous shard with the head of the current one.
+
+    Returns the results for all lines that could be completed and the new carry.
+    """
+    if shard.tail is None:
+        return [], carry + shard.head
+    return [fn(line) for line in _split_lines(carry + shard.head, encoding)], shard.tail
+
+
+def map_lines_sharded(
+    path: Path,
+    fn: Callable[[str], _T],
+    *,
+    encoding: str,
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    shard_size: int = 2 ** 26,  # 64 MiB
+    progress_bar: bool = False,
+    progress_bar_desc: Optional[str] = None,
+) -> Iterator[_T]:
+    """Applies fn to all lines of a file in parallel.
+
+    If the file is a seekable Zstandard file, it is split into shards of frames with
+    roughly shard_size compressed bytes, each of which is decompressed and processed
+    in a separate process. Otherwise, the file is processed sequentially via
+    DecompressingTextIOWrapper.
+
+    Since fn is executed in other processes, it must be picklable (i.e., a top-level
+    function). Lines are split on the byte level, so that encoding must be
+    ASCII-compatible (e.g., UTF-8). If ordered is False, results are returned as soon
+    as they are available, with the results for lines spanning shard boundaries being
+    returned last.
+    """
+
+    frames = (
+        read_seek_table(path) if detect_compression(path) == Compression.ZSTD else None
+    )
+    if not frames or len(frames) == 1:
+        _LOGGER.debug(
+            "File '{}' is not a seekable multi-frame Zstandard file, processing it "
+            "sequentially.",
+            path,
+        )
+        with DecompressingTextIOWrapper(
+            path,
+            encoding=encoding,
+            progress_bar=progress_bar,
+            progress_bar_desc=progress_bar_desc,
+        ) as fin:
+            for line in fin:
+                yield fn(line)
+        return
+
+    shards = _group_frames(frames, shard_size)
+    workers = workers or cpu_count() or 1
+    _LOGGER.debug(
+        "Processing file '{}' in {} shards with {} workers.",
+        path,
+        len(shards),
+        workers,
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, tqdm(
+        desc=progress_bar_desc or path.name,
+        total=path.stat().st_size,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        dynamic_ncols=True,
+        disable=not progress_bar,
+    ) as bar:
+
+        def submit(index: int) -> "Future[_ShardResult[_T]]":
+            return executor.submit(_process_shard, path, shards[index], encoding, fn)
+
+        # Only keep a limited number of shards in flight so that memory usage stays
+        # bounded when the consumer is slower than the workers.
+        max_pending = 2 * workers
+        if ordered:
+            yield from _map_ordered(submit, len(shards), max_pending, bar, encoding, fn)
+        else:
+            yield from _map_unordered(
+                submit, len(shards), max_pending, bar, encoding, fn
+            )
+
+
+def _map_ordered(
+    submit: Callable[[int], "Future[_ShardResult[_T]]"],
+    num_shards: int,
+    max_pending: int,
+    bar: "tqdm[None]",
+    encoding: str,
+    fn: Callable[[str], _T],
+) -> Iterator[_T]:
+    pending: Deque[Future[_ShardResult[_T]]] = deque()
+    next_index = 0
+    carry = b""
+    while pending or next_index < num_shards:
+        while next_index < num_shards and len(pending) < max_pending:
+            pending.append(submit(next_index))
+            next_index += 1
+
+        shard = pending.popleft().result()
+        bar.update(shard.compressed_size)
+        stitched, carry = _stitch_shard(carry, shard, encoding, fn)
+        yield from stitched
+        yield from shard.results
+
+    if carry:
+        yield from (fn(line) for line in _split_lines(carry, encoding))
+
+
+def _map_unordered(
+    submit: Callable[[int], "Future[_ShardResult[_T]]"],
+    num_shards: int,
+    max_pending: int,
+    bar: "tqdm[None]",
+    encoding: str,
+    fn: Callable[[str], _T],
+) -> Iterator[_T]:
+    pending: MutableMapping[Future[_ShardResult[_T]], int] = {}
+    boundaries: MutableMapping[int, _ShardResult[_T]] = {}
+    next_index = 0
+    while pending or next_index < num_shards:
+        while next_index < num_shards and len(pending) < max_pending:
+            pending[submit(next_index)] = next_index
+            next_index += 1
+
+        done: Set[Future[_ShardResult[_T]]] = wait(
+            pending, return_when=FIRST_COMPLETED
+        )[0]
+        for future in done:
+            index = pending.pop(future)
+            shard = future.result()
+            bar.update(shard.compressed_size)
+            yield from shard.results
+            boundaries[index] = _ShardResult(
+                head=shard.head,
+                tail=shard.tail,
+                results=[],
+                compressed_size=shard.compressed_size,
+            )
+
+    carry = b""
+    for index in range(num_shards):
+        stitched, carry = _stitch_shard(carry, boundaries[index], encoding, fn)
+        yield from stitched
+    if carry:
+        yield from (fn(line) for line in _split_lines(carry, encoding))
+
+
+def iter_lines_sharded(
+    path: Path,
+    *,
+    encoding: str,
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    shard_size: int = 2 ** 26,  # 64 MiB
+    progress_bar: bool = False,
+    progress_bar_desc: Optional[str] = None,
+) -> Iterator[str]:
+    """Iterates over all lines of a file, decompressing it in parallel.
+
+    See map_lines_sharded() for details.
+    """
+    return map_lines_sharded(
+        path,
+        _identity,
+        encoding=encoding,
+        workers=workers,
+        ordered=ordered,
+        shard_size=shard_size,
+        progress_bar=progress_bar,
+        progress_bar_desc=progress_bar_desc,
+    )
+
+
+# Chunks are tuples of the number of compressed bytes read after the chunk and lines.
+_Chunk = Tuple[int, Sequence[str]]
+
+
+def _apply(fn: Callable[[str], _T], lines: Sequence[str]) -> Sequence[_T]:
+    return [fn(line) for line in lines]
+
+
+def _read_chunks(
+    paths: Sequence[Path],
+    encoding: str,
+    chunk_lines: int,
+    chunks: "Queue[Union[_Chunk, BaseException, None]]",
+    stop: Event,
+) -> None:
+    def put(item: Union[_Chunk, BaseException, None]) -> None:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    try:
+        finished_size = 0
+        for path in paths:
+            with DecompressingTextIOWrapper(path, encoding=encoding) as fin:
+                lines = iter(fin)
+                while not stop.is_set():
+                    chunk = list(islice(lines, chunk_lines))
+                    if not chunk:
+                        break
+                    put((finished_size + fin.tell(), chunk))
+            finished_size += path.stat().st_size
+        put(None)
+    except BaseException as e:
+        put(e)
+
+
+def parallel_map_lines(
+    paths: Union[Path, Iterable[Path]],
+    fn: Callable[[str], _T],
+    *,
+    encoding: str,
+    workers: Optional[int] = None,
+    chunk_lines: int = 1024,
+    ordered: bool = True,
+    progress_bar: bool = False,
+    progress_bar_desc: Optional[str] = None,
+) -> Iterator[_T]:
+    """Applies fn to all lines of one or more (compressed) files in parallel.
+
+    Unlike map_lines_sharded(), this works for any file DecompressingTextIOWrapper can
+    read: a background thread reads the files one after another and sends chunks of
+    chunk_lines lines to a pool of worker processes. Decompression thus is not
+    parallelized, which makes this most useful if fn is expensive.
+
+    Since fn is executed in other processes, it must be picklable (i.e., a top-level
+    function). If ordered is False, results are returned as soon as they are
+    available. At most twice as many chunks as there are workers are buffered at any
+    time, so that memory usage stays bounded when the consumer is slower than the
+    workers. The progress bar shows the compressed bytes of the chunks processed so
+    far.
+    """
+    paths = [paths] if isinstance(paths, Path) else list(paths)
+    workers = workers or cpu_count() or 1
+    max_pending = 2 * workers
+
+    chunks: "Queue[Union[_Chunk, BaseException, None]]" = Queue(maxsize=max_pending)
+    stop = Event()
+    thread = Thread(
+        target=_read_chunks,
+        args=(paths, encoding, chunk_lines, chunks, stop),
+        name="parallel_map_lines",
+        daemon=True,
+    )
+
+    def next_chunk() -> Optional[_Chunk]:
+        item = chunks.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, tqdm(
+        desc=progress_bar_desc or (paths[0].name if len(paths) == 1 else None),
+        total=sum(path.stat().st_size for path in paths),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        dynamic_ncols=True,
+        disable=not progress_bar,
+    ) as bar:
+        thread.start()
+        try:
+            if ordered:
+                yield from _map_chunks_ordered(
+                    executor, next_chunk, max_pending, bar, fn
+                )
+            else:
+                yield from _map_chunks_unordered(
+                    executor, next_chunk, max_pending, bar, fn
+                )
+        finally:
+            stop.set()
+            # Unblock the reader thread if it is waiting for space in the queue.
+            try:
+                while True:
+                    chunks.get_nowait()
+            except Empty:
+                pass
+            thread.join()
+
+
+def _map_chunks_ordered(
+    executor: ProcessPoolExecutor,
+    next_chunk: Callable[[], Optional[_Chunk]],
+    max_pending: int,
+    bar: "tqdm[None]",
+    fn: Callable[[str], _T],
+) -> Iterator[_T]:
+    pending: Deque[Tuple[int, Future[Sequence[_T]]]] = deque()
+    eof = False
+    while pending or not eof:
+        while not eof and len(pending) < max_pending:
+            chunk = next_chunk()
+            if chunk is None:
+                eof = True
+            else:
+                pending.append((chunk[0], executor.submit(_apply, fn, chunk[1])))
+
+        if pending:
+            position, future = pending.popleft()
+            results = future.result()
+            bar.update(position - bar.n)
+            yield from results
+
+
+def _map_chunks_unordered(
+    executor: ProcessPoolExecutor,
+    next_chunk: Callable[[], Optional[_Chunk]],
+    max_pending: int,
+    bar: "tqdm[None]",
+    fn: Callable[[str], _T],
+) -> Iterator[_T]:
+    pending: MutableMapping[Future[Sequence[_T]], int] = {}
+    eof = False
+    while pending or not eof:
+        while not eof and len(pending) < max_pending:
+            chunk = next_chunk()
+            if chunk is None:
+                eof = True
+            else:
+                pending[executor.submit(_apply, fn, chunk[1])] = chunk[0]
+
+        if pending:
+            done: Set[Future[Sequence[_T]]] = wait(
+                pending, return_when=FIRST_COMPLETED
+            )[0]
+            for future in done:
+                position = pending.pop(future)
+                results = future.result()
+                bar.update(max(position - bar.n, 0))
+                yield from results
+
+
+@dataclass
+class ConsumerStats:
+    """Throughput statistics of a consumer of FanOutReader.
+
+    busy_seconds is the time spent in the consumer's function, blocked_seconds the
+    time the reader waited because the consumer's queue was full (i.e., the time the
+    consumer slowed down all others by).
+    """
+
+    name: str
+    batches: int = 0
+    lines: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / (self.busy_seconds or 1e-9)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.lines} lines in {self.batches} batches, "
+            f"{self.busy_seconds:.2f}s busy ({self.lines_per_second:.0f} lines/s), "
+            f"{self.blocked_seconds:.2f}s blocking the reader."
+        )
+
+
+class _Consumer:
+    def __init__(
+        self,
+        fn: Callable[[Sequence[str]], None],
+        stats: ConsumerStats,
+        max_pending_batches: Optional[int],
+    ):
+        self.fn = fn
+        self.stats = stats
+        self.error: Optional[BaseException] = None
+
+        self._queue: "Optional[Queue[Optional[Sequence[str]]]]" = None
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        if max_pending_batches is not None:
+            self._queue = Queue(maxsize=max_pending_batches)
+            self._thread = Thread(
+                target=self._run, name=f"FanOutReader-{stats.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _process(self, batch: Sequence[str]) -> None:
+        start = perf_counter()
+        self.fn(batch)
+        self.stats.busy_seconds += perf_counter() - start
+        self.stats.batches += 1
+        self.stats.lines += len(batch)
+
+    def _run(self) -> None:
+        assert self._queue is not None
+        try:
+            for batch in iter(self._queue.get, None):
+                if self._stop.is_set():
+                    return
+                self._process(batch)  # type: ignore
+        except BaseException as e:
+            self.error = e
+
+    def _put(self, item: Optional[Sequence[str]]) -> None:
+        assert self._queue is not None and self._thread is not None
+        start = perf_counter()
+        while True:
+            if self.error is not None:
+                raise self.error
+            if not self._thread.is_alive():
+                return
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except Full:
+                pass
+        self.stats.blocked_seconds += perf_counter() - start
+
+    def submit(self, batch: Sequence[str]) -> None:
+        if self._queue is None:
+            self._process(batch)
+        else:
+            self._put(batch)
+
+    def finish(self) -> None:
+        if self._thread is not None:
+            self._put(None)
+            self._thread.join()
+            if self.error is not None:
+                raise self.error
+
+    def abort(self) -> None:
+        if self._queue is None or self._thread is None:
+            return
+        self._stop.set()
+        # Unblock the thread if it is waiting for the next batch.
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            self._queue.put_nowait(None)
+        except Full:  # pragma: no cover
+            pass
+        self._thread.join()
+
+
+class FanOutReader:
+    """Reads a (compressed) file once and distributes its lines to several consumers.
+
+    Consumers are functions that are called with batches of batch_size lines. Those
+    added via add_callback() are called directly by the reader, those added via
+    add_thread() are called in a dedicated thread each, fed by a queue of at most
+    max_pending_batches batches. If a queue is full, the reader waits, so that the
+    slowest consumer determines the overall speed (and memory usage stays bounded).
+    Lines are only read once run() is called, which returns after all consumers have
+    processed all lines. If any consumer raises an exception, reading stops and
+    run() re-raises it.
+
+    Per-consumer throughput statistics are returned by run() and logged if log_stats
+    is set, together with those of the reader (see ReaderStats). See
+    DecompressingTextIOWrapper for the other arguments.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        encoding: str,
+        batch_size: int = 1024,
+        decompressor: DecompressorBackend = DecompressorBackend.PYTHON,
+        readahead: int = 0,
+        warn_uncompressed: bool = True,
+        progress_bar: bool = False,
+        progress_bar_desc: Optional[str] = None,
+        log_stats: bool = False,
+    ):
+        self.path = path
+        self.encoding = encoding
+        self.reader_stats: Optional[ReaderStats] = None
+
+        self._batch_size = batch_size
+        self._decompressor = decompressor
+        self._readahead = readahead
+        self._warn_uncompressed = warn_uncompressed
+        self._progress_bar = progress_bar
+        self._progress_bar_desc = progress_bar_desc
+        self._log_stats = log_stats
+        self._consumers: MutableSequence[
+            Tuple[Callable[[Sequence[str]], None], ConsumerStats, Optional[int]]
+        ] = []
+
+    def _add(
+        self,
+        fn: Callable[[Sequence[str]], None],
+        name: Optional[str],
+        max_pending_batches: Optional[int],
+    ) -> ConsumerStats:
+        stats = ConsumerStats(
+            name or getattr(fn, "__name__", None) or f"consumer-{len(self._consumers)}"
+        )
+        self._consumers.append((fn, stats, max_pending_batches))
+        return stats
+
+    def add_callback(
+        self, fn: Callable[[Sequence[str]], None], *, name: Optional[str] = None
+    ) -> ConsumerStats:
+        """Adds a consumer that is called in the reading thread."""
+        return self._add(fn, name, None)
+
+    def add_thread(
+        self,
+        fn: Callable[[Sequence[str]], None],
+        *,
+        name: Optional[str] = None,
+        max_pending_batches: int = 16,
+    ) -> ConsumerStats:
+        """Adds a consumer that is called in its own thread."""
+        return self._add(fn, name, max_pending_batches)
+
+    def run(self) -> Sequence[ConsumerStats]:
+        consumers = [_Consumer(*consumer) for consumer in self._consumers]
+        try:
+            with DecompressingTextIOWrapper(
+                self.path,
+                encoding=self.encoding,
+                decompressor=self._decompressor,
+                readahead=self._readahead,
+                warn_uncompressed=self._warn_uncompressed,
+                progress_bar=self._progress_bar,
+                progress_bar_desc=self._progress_bar_desc,
+                stats=True,
+                log_stats=self._log_stats,
+            ) as fin:
+                lines = iter(fin)
+                for batch in iter(lambda: list(islice(lines, self._batch_size)), []):
+                    for consumer in consumers:
+                        consumer.submit(batch)
+                self.reader_stats = fin.stats
+            for consumer in consumers:
+                consumer.finish()
+        finally:
+            for consumer in consumers:
+                consumer.abort()
+
+        if self._log_stats:
+            for consumer in consumers:
+                _LOGGER.info("Consumer of '{}': {}", self.path, consumer.stats)
+        return [consumer.stats for consumer in consumers]
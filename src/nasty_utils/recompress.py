@@ -0,0 +1,223 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+from overrides import overrides
+from tqdm import tqdm
+
+from nasty_utils._util.io_ import compressing_writer
+from nasty_utils.io_ import Compression, DecompressingBinaryReader
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+from nasty_utils.program import Argument, ArgumentGroup, Program, ProgramConfig
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_CHUNK_SIZE = 2 ** 20  # 1 MiB
+_RECOMPRESSED_COMPRESSIONS = (Compression.GZIP, Compression.BZIP2, Compression.XZ)
+
+
+def _hash_decompressed(path: Path) -> Tuple[str, int]:
+    """Returns the SHA-256 digest and number of lines of the contents of a file."""
+    h = hashlib.sha256()
+    num_lines = 0
+    with DecompressingBinaryReader(path, warn_uncompressed=False) as fin:
+        for block in fin.iter_blocks(_CHUNK_SIZE):
+            h.update(block)
+            num_lines += block.count(b"\n")
+    return h.hexdigest(), num_lines
+
+
+def recompressed_path(source: Path) -> Path:
+    """Returns the path of the Zstandard version of source, next to it."""
+    if Compression.from_suffix(source) is not None:
+        source = source.with_suffix("")
+    return source.with_name(source.name + Compression.ZSTD.value)
+
+
+def recompress_file(
+    source: Path,
+    destination: Path,
+    *,
+    compression_level: Optional[int] = None,
+    frame_size: Optional[int] = None,
+    verify: bool = True,
+) -> None:
+    """Recompresses a (compressed) file to Zstandard.
+
+    The output is written to a temporary file and only renamed to destination once it
+    has been written completely (and, if verify is set, its decompressed contents have
+    been checked to have the same SHA-256 digest and number of lines as those of
+    source). Afterwards, destination gets the same access and modification times as
+    source. If frame_size is given, output is written in the seekable format.
+    """
+    stat = source.stat()
+    tmp_path = destination.with_name(destination.name + ".tmp")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+
+    h = hashlib.sha256()
+    num_lines = 0
+    try:
+        with DecompressingBinaryReader(
+            source, warn_uncompressed=False
+        ) as fin, tmp_path.open("wb") as fp:
+            # Parallelism happens across files, so don't use compression threads.
+            fout = compressing_writer(
+                fp,
+                Compression.ZSTD,
+                compression_level=compression_level,
+                threads=0,
+                frame_size=frame_size,
+                zstd_dict=None,
+            )
+            for block in fin.iter_blocks(_CHUNK_SIZE):
+                fout.write(block)
+                h.update(block)
+                num_lines += block.count(b"\n")
+            fout.close()
+
+        if verify:
+            digest, recompressed_num_lines = _hash_decompressed(tmp_path)
+            if digest != h.hexdigest() or recompressed_num_lines != num_lines:
+                raise ValueError(
+                    f"Verification of recompressed file '{destination}' failed: "
+                    f"{recompressed_num_lines} lines with digest {digest} instead of "
+                    f"{num_lines} lines with digest {h.hexdigest()}."
+                )
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    tmp_path.replace(destination)
+
+
+class RecompressProgram(Program):
+    """Recompresses all gzip, bzip2, and xz files in a directory tree to Zstandard.
+
+    Meant to be included as one of the subprograms of another Program. Files that
+    already have an up-to-date recompressed version (i.e., one with the same
+    modification time) are skipped, so that an interrupted run can be resumed by
+    running it again.
+    """
+
+    class Config(ProgramConfig):
+        title = "recompress"
+        description = "Recompress gzip, bzip2, and xz files to Zstandard."
+
+    source: Path = Argument(
+        short_alias="s",
+        metavar="DIR",
+        description="Directory that is searched recursively for files to recompress.",
+    )
+    destination: Optional[Path] = Argument(
+        None,
+        short_alias="d",
+        metavar="DIR",
+        description=(
+            "Directory to write recompressed files to, mirroring the structure of "
+            "source. Defaults to writing them next to the original files."
+        ),
+    )
+    compression_level: Optional[int] = Argument(
+        None,
+        alias="compression-level",
+        metavar="LEVEL",
+        description="Zstandard compression level (default: 3).",
+        group=ArgumentGroup("Compression"),
+    )
+    frame_size: Optional[int] = Argument(
+        None,
+        alias="frame-size",
+        metavar="BYTES",
+        description=(
+            "Write seekable Zstandard files with frames of this many uncompressed "
+            "bytes each."
+        ),
+        group=ArgumentGroup("Compression"),
+    )
+    workers: Optional[int] = Argument(
+        None,
+        short_alias="j",
+        metavar="N",
+        description="Number of processes to use (default: number of CPUs).",
+    )
+    no_verify: bool = Argument(
+        False,
+        alias="no-verify",
+        description="Skip comparing line counts and digests after recompressing.",
+    )
+    delete: bool = Argument(
+        False, description="Delete original files after successful recompression."
+    )
+
+    def _find_jobs(self) -> Sequence[Tuple[Path, Path]]:
+        jobs = []
+        for source in sorted(self.source.rglob("*")):
+            if (
+                not source.is_file()
+                or Compression.from_suffix(source) not in _RECOMPRESSED_COMPRESSIONS
+            ):
+                continue
+
+            destination = recompressed_path(source)
+            if self.destination is not None:
+                destination = self.destination / destination.relative_to(self.source)
+            if (
+                destination.exists()
+                and destination.stat().st_mtime_ns == source.stat().st_mtime_ns
+            ):
+                _LOGGER.debug("Skipping already recompressed file '{}'.", source)
+                continue
+            jobs.append((source, destination))
+        return jobs
+
+    @overrides
+    def run(self) -> None:
+        jobs = self._find_jobs()
+        _LOGGER.info("Recompressing {} files in '{}'.", len(jobs), self.source)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor, tqdm(
+            desc="Recompressing",
+            total=sum(source.stat().st_size for source, _ in jobs),
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            dynamic_ncols=True,
+        ) as progress_bar:
+            futures = {
+                executor.submit(
+                    recompress_file,
+                    source,
+                    destination,
+                    compression_level=self.compression_level,
+                    frame_size=self.frame_size,
+                    verify=not self.no_verify,
+                ): source
+                for source, destination in jobs
+            }
+            for future in as_completed(futures):
+                source = futures[future]
+                future.result()
+                progress_bar.update(source.stat().st_size)
+                if self.delete:
+                    source.unlink()
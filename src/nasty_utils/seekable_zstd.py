@@ -0,0 +1,211 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Support for the seekable Zstandard format.
+
+A seekable Zstandard file is a sequence of independent Zstandard frames followed by
+a seek table stored in a skippable frame. See:
+https://github.com/facebook/zstd/blob/dev/contrib/seekable_format/zstd_seekable_compression_format.md
+"""
+
+import struct
+from dataclasses import dataclass
+from io import RawIOBase
+from pathlib import Path
+from typing import BinaryIO, MutableSequence, Optional, Sequence
+
+from overrides import overrides
+from zstandard import ZstdCompressionDict, ZstdCompressor, ZstdDecompressor
+
+_SKIPPABLE_MAGIC_NUMBER = 0x184D2A5E
+_SEEKABLE_MAGIC_NUMBER = 0x8F92EAB1
+_SEEK_TABLE_FOOTER = struct.Struct("<IBI")
+_SEEK_TABLE_HEADER = struct.Struct("<II")
+_SEEK_TABLE_ENTRY = struct.Struct("<II")
+_SEEK_TABLE_ENTRY_WITH_CHECKSUM = struct.Struct("<III")
+_CHECKSUM_FLAG = 0x80
+_RESERVED_BITS = 0x7C
+
+
+@dataclass(frozen=True)
+class ZstdFrame:
+    compressed_offset: int
+    compressed_size: int
+    decompressed_offset: int
+    decompressed_size: int
+
+    def decompress(
+        self, fp: BinaryIO, zstd_dict: Optional[ZstdCompressionDict] = None
+    ) -> bytes:
+        fp.seek(self.compressed_offset)
+        return ZstdDecompressor(dict_data=zstd_dict).decompress(
+            fp.read(self.compressed_size), max_output_size=self.decompressed_size
+        )
+
+
+def read_seek_table(path: Path) -> Optional[Sequence[ZstdFrame]]:
+    """Reads the frames of a seekable Zstandard file.
+
+    Returns None, if the file does not end with a valid seek table.
+    """
+    with path.open("rb") as fin:
+        file_size = fin.seek(0, 2)
+        if file_size < _SEEK_TABLE_HEADER.size + _SEEK_TABLE_FOOTER.size:
+            return None
+
+        fin.seek(file_size - _SEEK_TABLE_FOOTER.size)
+        num_frames, descriptor, magic = _SEEK_TABLE_FOOTER.unpack(
+            fin.read(_SEEK_TABLE_FOOTER.size)
+        )
+        if magic != _SEEKABLE_MAGIC_NUMBER or descriptor & _RESERVED_BITS:
+            return None
+
+        entry = (
+            _SEEK_TABLE_ENTRY_WITH_CHECKSUM
+            if descriptor & _CHECKSUM_FLAG
+            else _SEEK_TABLE_ENTRY
+        )
+        seek_table_size = (
+            _SEEK_TABLE_HEADER.size + num_frames * entry.size + _SEEK_TABLE_FOOTER.size
+        )
+        if file_size < seek_table_size:
+            return None
+
+        fin.seek(file_size - seek_table_size)
+        skippable_magic, frame_size = _SEEK_TABLE_HEADER.unpack(
+            fin.read(_SEEK_TABLE_HEADER.size)
+        )
+        if (
+            skippable_magic != _SKIPPABLE_MAGIC_NUMBER
+            or frame_size != seek_table_size - _SEEK_TABLE_HEADER.size
+        ):
+            return None
+
+        frames = []
+        compressed_offset = 0
+        decompressed_offset = 0
+        for values in entry.iter_unpack(fin.read(num_frames * entry.size)):
+            compressed_size, decompressed_size = values[0], values[1]
+            frames.append(
+                ZstdFrame(
+                    compressed_offset=compressed_offset,
+                    compressed_size=compressed_size,
+                    decompressed_offset=decompressed_offset,
+                    decompressed_size=decompressed_size,
+                )
+            )
+            compressed_offset += compressed_size
+            decompressed_offset += decompressed_size
+
+        if compressed_offset != file_size - seek_table_size:
+            return None
+        return frames
+
+
+class SeekableZstdWriter(RawIOBase):
+    """Writes data as seekable Zstandard file.
+
+    A new frame is started as soon as the current one holds at least frame_size
+    uncompressed bytes and a newline is encountered, so that frames (except for those
+    containing overly long lines) always end on line boundaries.
+    """
+
+    def __init__(self, fp: BinaryIO, *, compressor: ZstdCompressor, frame_size: int):
+        super().__init__()
+        self._fp = fp
+        self._compressor = compressor
+        self._frame_size = frame_size
+
+        self._frames: MutableSequence[ZstdFrame] = []
+        self._compressobj = self._compressor.compressobj()
+        self._compressed_offset = 0
+        self._decompressed_offset = 0
+        self._current_compressed_size = 0
+        self._current_decompressed_size = 0
+
+    @property
+    def frames(self) -> Sequence[ZstdFrame]:
+        return self._frames
+
+    @overrides
+    def writable(self) -> bool:
+        return True
+
+    @overrides
+    def write(self, b: bytes) -> int:  # type: ignore[override]  # noqa: F821
+        b = bytes(b)
+        data = memoryview(b)
+        pos = 0
+        while pos < len(data):
+            missing = max(self._frame_size - self._current_decompressed_size, 1)
+            end = b.find(b"\n", pos + missing - 1)
+            if end == -1:
+                self._write_to_frame(data[pos:])
+                break
+            self._write_to_frame(data[pos : end + 1])
+            self._end_frame()
+            pos = end + 1
+        return len(data)
+
+    def _write_to_frame(self, data: memoryview) -> None:
+        compressed = self._compressobj.compress(data)
+        self._fp.write(compressed)
+        self._current_compressed_size += len(compressed)
+        self._current_decompressed_size += len(data)
+
+    def _end_frame(self) -> None:
+        compressed = self._compressobj.flush()
+        self._fp.write(compressed)
+        self._current_compressed_size += len(compressed)
+
+        self._frames.append(
+            ZstdFrame(
+                compressed_offset=self._compressed_offset,
+                compressed_size=self._current_compressed_size,
+                decompressed_offset=self._decompressed_offset,
+                decompressed_size=self._current_decompressed_size,
+            )
+        )
+        self._compressed_offset += self._current_compressed_size
+        self._decompressed_offset += self._current_decompressed_size
+        self._current_compressed_size = 0
+        self._current_decompressed_size = 0
+        self._compressobj = self._compressor.compressobj()
+
+    def _write_seek_table(self) -> None:
+        self._fp.write(
+            _SEEK_TABLE_HEADER.pack(
+                _SKIPPABLE_MAGIC_NUMBER,
+                len(self._frames) * _SEEK_TABLE_ENTRY.size + _SEEK_TABLE_FOOTER.size,
+            )
+        )
+        for frame in self._frames:
+            self._fp.write(
+                _SEEK_TABLE_ENTRY.pack(frame.compressed_size, frame.decompressed_size)
+            )
+        self._fp.write(
+            _SEEK_TABLE_FOOTER.pack(len(self._frames), 0, _SEEKABLE_MAGIC_NUMBER)
+        )
+
+    @overrides
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self._current_decompressed_size or not self._frames:
+            self._end_frame()
+        self._write_seek_table()
+        self._fp.close()
+        super().close()
@@ -0,0 +1,250 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import sys
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from heapq import merge
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from nasty_utils.io_ import CompressingTextIOWrapper, DecompressingTextIOWrapper
+from nasty_utils.logging_ import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+# Runs are temporary, so favor speed over compression ratio.
+_RUN_COMPRESSION_LEVEL = 1
+
+
+def _unique(lines: Iterable[str], key: Optional[Callable[[str], Any]]) -> Iterator[str]:
+    """Drops lines with the same key as the previous line."""
+    sentinel = previous = object()
+    for line in lines:
+        current = key(line) if key else line
+        if previous is sentinel or current != previous:
+            yield line
+        previous = current
+
+
+def _write_lines(
+    lines: Iterable[str],
+    path: Path,
+    *,
+    encoding: str,
+    key: Optional[Callable[[str], Any]],
+    unique: bool,
+    compression_level: Optional[int],
+) -> int:
+    if unique:
+        lines = _unique(lines, key)
+    num_lines = 0
+    with CompressingTextIOWrapper(
+        path,
+        encoding=encoding,
+        compression_level=compression_level,
+        threads=0,
+        warn_uncompressed=False,
+    ) as fout:
+        for line in lines:
+            fout.write(line)
+            num_lines += 1
+    return num_lines
+
+
+def _write_run(
+    lines: List[str],
+    path: Path,
+    encoding: str,
+    key: Optional[Callable[[str], Any]],
+    unique: bool,
+) -> int:
+    lines.sort(key=key)
+    return _write_lines(
+        lines,
+        path,
+        encoding=encoding,
+        key=key,
+        unique=unique,
+        compression_level=_RUN_COMPRESSION_LEVEL,
+    )
+
+
+def _merge_runs(
+    runs: Sequence[Path],
+    path: Path,
+    *,
+    encoding: str,
+    key: Optional[Callable[[str], Any]],
+    unique: bool,
+    compression_level: Optional[int],
+    delete: bool = False,
+) -> Tuple[Path, int]:
+    """Merges sorted runs into path, returns it and the number of lines written."""
+    with ExitStack() as stack:
+        readers = [
+            stack.enter_context(DecompressingTextIOWrapper(run, encoding=encoding))
+            for run in runs
+        ]
+        # heapq.merge() is stable, so that of lines with equal keys those from earlier
+        # runs (i.e., those that occurred earlier in the input) come first.
+        num_lines = _write_lines(
+            merge(*readers, key=key),
+            path,
+            encoding=encoding,
+            key=key,
+            unique=unique,
+            compression_level=compression_level,
+        )
+    if delete:
+        for run in runs:
+            run.unlink()
+    return path, num_lines
+
+
+def _iter_chunks(
+    sources: Iterable[Path], *, encoding: str, size: int, progress_bar: bool
+) -> Iterator[Tuple[List[str], bool]]:
+    """Iterates over chunks of lines that take up about size bytes of memory each.
+
+    Yields tuples of the lines and whether the chunk is full. Only the last chunk is
+    not full (and possibly empty).
+    """
+    lines: List[str] = []
+    lines_size = 0
+    for source in sources:
+        with DecompressingTextIOWrapper(
+            source, encoding=encoding, progress_bar=progress_bar
+        ) as fin:
+            for line in fin:
+                if not line.endswith("\n"):
+                    line += "\n"
+                lines.append(line)
+                lines_size += sys.getsizeof(line)
+                if lines_size >= size:
+                    yield lines, True
+                    lines = []
+                    lines_size = 0
+    yield lines, False
+
+
+def sort_lines(
+    sources: Iterable[Path],
+    destination: Path,
+    *,
+    encoding: str,
+    key: Optional[Callable[[str], Any]] = None,
+    unique: bool = False,
+    max_memory: int = 2 ** 30,  # 1 GiB
+    workers: int = 1,
+    fan_in: int = 64,
+    tmp_dir: Optional[Path] = None,
+    compression_level: Optional[int] = None,
+    progress_bar: bool = False,
+) -> int:
+    """Sorts the lines of (compressed) files with bounded memory usage.
+
+    Lines are read until their size reaches max_memory, then sorted by key and written
+    to a temporary Zstandard file (a run) in tmp_dir (or the system's default). Runs
+    are merged fan_in at a time until the last merge writes destination, compressed
+    based on its extension. The sort is stable. If unique is set, only the first of
+    all lines with the same key is kept. Returns the number of lines written.
+
+    If workers is larger than 1, runs are sorted and written in that many processes
+    while reading continues, in which case max_memory is split between them and key
+    must be picklable (i.e., a top-level function). Note that max_memory only accounts
+    for the lines themselves and not the keys computed while sorting.
+    """
+
+    with TemporaryDirectory(
+        prefix="nasty-utils-sort-", dir=str(tmp_dir) if tmp_dir else None
+    ) as tmp, ExitStack() as stack:
+        executor: Optional[Executor] = None
+        run_memory = max_memory
+        if workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            # The runs being sorted by the workers and the one being filled.
+            run_memory = max_memory // (workers + 1)
+
+        runs: MutableSequence[Path] = []
+        pending: Deque[Future[int]] = deque()
+        for lines, full in _iter_chunks(
+            sources, encoding=encoding, size=run_memory, progress_bar=progress_bar
+        ):
+            if not full and not runs:
+                _LOGGER.debug("Sorting {} lines in memory.", len(lines))
+                lines.sort(key=key)
+                return _write_lines(
+                    lines,
+                    destination,
+                    encoding=encoding,
+                    key=key,
+                    unique=unique,
+                    compression_level=compression_level,
+                )
+            if not lines:
+                continue
+
+            runs.append(Path(tmp) / f"run-{len(runs)}.zst")
+            if executor is None:
+                _write_run(lines, runs[-1], encoding, key, unique)
+                continue
+            pending.append(
+                executor.submit(_write_run, lines, runs[-1], encoding, key, unique)
+            )
+            if len(pending) >= workers:
+                pending.popleft().result()
+        del lines  # Don't hold on to the last chunk while merging.
+        while pending:
+            pending.popleft().result()
+
+        _LOGGER.debug("Merging {} sorted runs.", len(runs))
+        while len(runs) > fan_in:
+            runs = [
+                _merge_runs(
+                    runs[i : i + fan_in],
+                    Path(tmp) / f"merged-{len(runs)}-{i}.zst",
+                    encoding=encoding,
+                    key=key,
+                    unique=unique,
+                    compression_level=_RUN_COMPRESSION_LEVEL,
+                    delete=True,
+                )[0]
+                for i in range(0, len(runs), fan_in)
+            ]
+
+        return _merge_runs(
+            runs,
+            destination,
+            encoding=encoding,
+            key=key,
+            unique=unique,
+            compression_level=compression_level,
+        )[1]
@@ -0,0 +1,53 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+from pathlib import Path
+from typing import Sequence
+
+from nasty_utils import AsyncDecompressingTextIOWrapper, CompressingTextIOWrapper
+
+
+def test_async_decompressing_text_io_wrapper(tmp_path: Path) -> None:
+    lines = [f"Line {i}\n" for i in range(10000)]
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(lines))
+
+    async def read_all(batch_size: int, progress_bar: bool) -> Sequence[str]:
+        async with AsyncDecompressingTextIOWrapper(
+            file, encoding="UTF-8", batch_size=batch_size, progress_bar=progress_bar
+        ) as fin:
+            result = [await fin.readline()]
+            result.extend(await fin.read_batch())
+            result.extend([line async for line in fin])
+            assert await fin.readline() == ""
+            assert fin.tell() == fin.size()
+            return result
+
+    async def read_some() -> str:
+        async with AsyncDecompressingTextIOWrapper(
+            file, encoding="UTF-8", batch_size=10
+        ) as fin:
+            return await fin.readline()
+
+    loop = asyncio.new_event_loop()
+    try:
+        for batch_size, progress_bar in [(1000, True), (10000, False), (7, False)]:
+            assert loop.run_until_complete(read_all(batch_size, progress_bar)) == lines
+        assert loop.run_until_complete(read_some()) == lines[0]
+    finally:
+        loop.close()
@@ -0,0 +1,89 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import os
+from pathlib import Path
+
+from pytest import raises
+
+from nasty_utils import ColumnCache, CompressingTextIOWrapper
+
+
+def test_column_cache(tmp_path: Path) -> None:
+    records = [
+        {
+            "id": i,
+            "score": i / 4,
+            "flag": i % 2 == 0,
+            "text": f"Tweet ä {i}",
+            "user": {"id": i % 7} if i % 3 else {},
+            "tags": ["a"] * (i % 3),
+        }
+        for i in range(1000)
+    ]
+    fields = ["id", "score", "flag", "text", "user.id", "tags", "missing"]
+
+    file = tmp_path / "file.jsonl.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        for record in records:
+            fout.write(json.dumps(record) + "\n")
+
+    cache = ColumnCache(tmp_path / "cache")
+    for _ in range(2):
+        columns = cache.load(file, fields)
+        assert [columns[field].type for field in fields] == [
+            "int",
+            "float",
+            "bool",
+            "str",
+            "int",
+            "json",
+            "json",
+        ]
+        assert list(columns["id"]) == [r["id"] for r in records]
+        assert list(columns["score"]) == [r["score"] for r in records]
+        assert list(columns["flag"]) == [r["flag"] for r in records]
+        assert list(columns["text"]) == [r["text"] for r in records]
+        assert list(columns["user.id"]) == [r["user"].get("id") for r in records]
+        assert list(columns["tags"]) == [r["tags"] for r in records]
+        assert list(columns["missing"]) == [None] * len(records)
+        assert columns["id"][-1] == 999
+        assert columns["text"][10:12] == ["Tweet ä 10", "Tweet ä 11"]
+        assert columns["id"].buffer.tolist() == list(range(1000))
+        with raises(TypeError):
+            columns["text"].buffer
+        with raises(IndexError):
+            columns["id"][1000]
+    (entry_dir,) = (tmp_path / "cache").iterdir()
+
+    # Touching the file does not invalidate the cache, changing its contents does.
+    os.utime(file, ns=(0, 0))
+    assert len(cache.load(file, ["id"])["id"]) == 1000
+    assert cache.load(file, fields).keys() == set(fields)
+    assert entry_dir.exists()
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write('{"id": 1}\n')
+    assert list(cache.load(file, ["id"])["id"]) == [1]
+
+    empty = tmp_path / "empty.jsonl"
+    empty.write_bytes(b"")
+    assert len(cache.load(empty, ["id"])["id"]) == 0
+
+    # Least recently used entries are evicted once the cache is too large.
+    cache.max_bytes = 0
+    assert list(cache.load(file, ["text"])["text"]) == [None]
+    assert len(list((tmp_path / "cache").iterdir())) == 1
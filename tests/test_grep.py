@@ -0,0 +1,123 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import logging
+from pathlib import Path
+
+from _pytest.logging import LogCaptureFixture
+from pytest import raises
+
+from nasty_utils import (
+    CompressingTextIOWrapper,
+    Compression,
+    DecompressingTextIOWrapper,
+    GrepProgram,
+    grep_file,
+)
+
+
+def test_grep_program(tmp_path: Path) -> None:
+    records = [
+        {"id": i, "lang": ["en", "de", "fr"][i % 3], "text": f"Tweet {i}"}
+        for i in range(3000)
+    ]
+    lines = [json.dumps(record) + "\n" for record in records]
+
+    source = tmp_path / "source"
+    files = [source / "a.jsonl.gz", source / "b" / "c.jsonl.zst", source / "d.txt"]
+    for i, file in enumerate(files):
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fout:
+            fout.write("".join(lines[i * 1000 : (i + 1) * 1000]))
+
+    for output in [tmp_path / "out.jsonl.zst", tmp_path / "out.jsonl.gz"]:
+        GrepProgram.init(
+            "-e", "TWEET 1[0-9]*0\\b", "-i", "-s", str(source), "-o", str(output)
+        ).run()
+        with DecompressingTextIOWrapper(output, encoding="UTF-8") as fin:
+            assert fin.compression == Compression.from_suffix(output)
+            assert list(fin) == [
+                line
+                for line, record in zip(lines, records)
+                if str(record["id"]).startswith("1") and record["id"] % 10 == 0
+            ]
+
+    # Only the field is matched, not the whole line.
+    output = tmp_path / "out.jsonl"
+    GrepProgram.init(
+        "-e",
+        '"de"',
+        "--field",
+        "lang",
+        "--value",
+        "^de$",
+        "--source",
+        str(source),
+        "--glob",
+        "*.jsonl.*",
+        "--output",
+        str(output),
+        "-j",
+        "2",
+    ).run()
+    assert output.read_text(encoding="UTF-8") == "".join(
+        line for line, record in zip(lines[:2000], records) if record["lang"] == "de"
+    )
+    assert not (tmp_path / "out.jsonl.tmp").exists()
+
+    GrepProgram.init(
+        "--field", "id", "--value", "^2999$", "-s", str(source), "-o", str(output)
+    ).run()
+    assert output.read_text(encoding="UTF-8") == lines[-1]
+    with raises(ValueError):
+        GrepProgram.init("--field", "id", "-s", str(source), "-o", str(output)).run()
+
+
+def test_grep_program_malformed(tmp_path: Path, caplog: LogCaptureFixture) -> None:
+    source = tmp_path / "source.jsonl"
+    source.write_text(
+        '{"lang": "de"}\n{"lang": "en"}\nnot json\n\n{"lang": "de"}\n',
+        encoding="UTF-8",
+    )
+    output = tmp_path / "out.jsonl"
+
+    with raises(ValueError, match=r"line 3 of file '.*source\.jsonl'"):
+        GrepProgram.init(
+            "--field", "lang", "--value", "de", "-s", str(source), "-o", str(output)
+        ).run()
+    assert not output.exists()
+
+    GrepProgram.init(
+        "--field",
+        "lang",
+        "--value",
+        "de",
+        "--skip-malformed",
+        "-s",
+        str(source),
+        "-o",
+        str(output),
+    ).run()
+    assert output.read_text(encoding="UTF-8") == '{"lang": "de"}\n' * 2
+
+    with caplog.at_level(logging.WARNING):
+        assert grep_file(
+            source, output, field="lang", value_pattern="de", skip_malformed=True
+        ) == (5, 2)
+    assert "Skipped 1 malformed out of 5 lines" in caplog.text
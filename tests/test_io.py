@@ -16,14 +16,40 @@
 
 import bz2
 import gzip
+import logging
 import lzma
+import os
+import sys
+import threading
+from datetime import date
 from pathlib import Path
-from typing import Optional, TextIO, cast
+from shutil import which
+from subprocess import PIPE, Popen
+from typing import BinaryIO, Optional, TextIO, cast
 
+from _pytest.logging import LogCaptureFixture
+from _pytest.monkeypatch import MonkeyPatch
+from pytest import raises, skip
 from typing_extensions import Protocol
 from zstandard import ZstdCompressor
 
-from nasty_utils import DecompressingTextIOWrapper
+import nasty_utils.io_
+from nasty_utils import (
+    ZSTD_DICT_FILE_NAME,
+    ChecksumMismatchError,
+    CompressingTextIOWrapper,
+    Compression,
+    DecompressingBinaryReader,
+    DecompressingTextIOWrapper,
+    DecompressorBackend,
+    MemoryMappedLineReader,
+    MultiFileTextReader,
+    ShardedCompressingWriter,
+    count_lines,
+    detect_compression,
+    sha256sum,
+    train_zstd_dict,
+)
 
 
 class _TOpenFunc(Protocol):
@@ -77,3 +103,595 @@ def test_decompressing_text_io_wrapper(tmp_path: Path) -> None:
         assert fin.tell() == 0
         assert fin.read() == content
         assert fin.tell() > 0
+
+
+def test_compressing_text_io_wrapper(tmp_path: Path) -> None:
+    content = "This is just\nsome test content.\n" * 100
+
+    for extension in ["txt", "gz", "bz2", "xz", "zst"]:
+        for compression_level, progress_bar in [(None, True), (1, False)]:
+            file = tmp_path / ("file." + extension)
+            with CompressingTextIOWrapper(
+                file,
+                encoding="UTF-8",
+                compression_level=compression_level,
+                warn_uncompressed=False,
+                progress_bar=progress_bar,
+            ) as fout:
+                fout.write(content)
+
+            with DecompressingTextIOWrapper(
+                file, encoding="UTF-8", warn_uncompressed=False
+            ) as fin:
+                assert fin.read() == content
+
+        # Closing explicitly instead of via a with-block finalizes the file as well.
+        fout = CompressingTextIOWrapper(file, encoding="UTF-8", warn_uncompressed=False)
+        fout.write(content)
+        fout.close()
+        fout.close()
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fin:
+            assert fin.read() == content
+
+
+def test_detect_compression(tmp_path: Path) -> None:
+    content = "This is just\nsome test content.\n"
+
+    file = tmp_path / "file.txt"
+    file.write_text(content, encoding="UTF-8")
+    assert detect_compression(file) is None
+
+    for compression in Compression:
+        file = tmp_path / ("file" + compression.value)
+        with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+            fout.write(content)
+        assert detect_compression(file) == compression
+
+        # Misnamed files are still read correctly.
+        misnamed_file = file.rename(tmp_path / ("misnamed-" + file.name + ".txt"))
+        with DecompressingTextIOWrapper(misnamed_file, encoding="UTF-8") as fin:
+            assert fin.compression == compression
+            assert fin.read() == content
+
+    # Cache is invalidated when the file is modified.
+    file = tmp_path / "file.zst"
+    file.write_text(content, encoding="UTF-8")
+    os.utime(file, ns=(0, 0))
+    assert detect_compression(file) is None
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write(content)
+    assert detect_compression(file) == Compression.ZSTD
+
+
+def test_decompressing_text_io_wrapper_readahead(tmp_path: Path) -> None:
+    content = "".join(f"Line {i}\n" for i in range(10000))
+
+    for compression in Compression:
+        file = tmp_path / ("file" + compression.value)
+        with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+            fout.write(content)
+
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", readahead=2, readahead_chunk_size=1000
+        ) as fin:
+            assert fin.tell() == 0
+            assert "".join(fin) == content
+            assert fin.tell() == fin.size()
+
+    # Errors of the read-ahead thread are raised on every following read.
+    file = tmp_path / "truncated.gz"
+    data = gzip.compress(content.encode("UTF-8"))
+    file.write_bytes(data[: len(data) // 2])
+    with DecompressingTextIOWrapper(file, encoding="UTF-8", readahead=2) as fin:
+        for _ in range(2):
+            with raises(EOFError):
+                fin.read()
+
+        # Closing before having read everything stops the background thread.
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", readahead=1, readahead_chunk_size=10
+        ) as fin:
+            assert fin.readline() == "Line 0\n"
+
+
+def test_decompressing_text_io_wrapper_progress_bar(tmp_path: Path) -> None:
+    content = "".join(f"Line {i}\n" for i in range(10000))
+
+    file = tmp_path / "file.txt"
+    file.write_text(content, encoding="UTF-8")
+
+    with DecompressingTextIOWrapper(
+        file, encoding="UTF-8", progress_bar=True, progress_bar_interval=0
+    ) as fin:
+        progress_bar = fin._progress_bar
+        assert progress_bar is not None
+        assert fin.readline() == "Line 0\n"
+        assert 0 < progress_bar.n < fin.size()
+        assert "".join(fin) == content[len("Line 0\n") :]
+        assert progress_bar.n == fin.size()
+
+
+def test_decompressing_reader_iteration_stopped_early(tmp_path: Path) -> None:
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(f"{i}\n" for i in range(5000)))
+
+    for kwargs in [{}, {"progress_bar": True}, {"stats": True}]:
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", **kwargs  # type: ignore
+        ) as fin:
+            for line in fin:
+                if line == "3\n":
+                    break
+            assert fin.readline() == "4\n"
+            stats = fin.stats
+            assert stats is None or stats.lines == 5
+
+        with DecompressingBinaryReader(file, **kwargs) as fin_binary:  # type: ignore
+            for line_binary in fin_binary:
+                if line_binary == b"3\n":
+                    break
+            assert fin_binary.readline() == b"4\n"
+
+
+def test_decompressing_reader_iteration_bypasses_readline(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    # Iterating must not call the Python-level readline() for every line, as that is
+    # several times slower than reading lines in C.
+    file = tmp_path / "file.gz"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(f"{i}\n" for i in range(5000)))
+
+    calls = []
+    for cls in [DecompressingTextIOWrapper, DecompressingBinaryReader]:
+        monkeypatch.setattr(cls, "readline", lambda *args: calls.append(args))
+
+    for kwargs in [{}, {"progress_bar": True}, {"stats": True}]:
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", **kwargs  # type: ignore
+        ) as fin:
+            assert len(list(fin)) == 5000
+        with DecompressingBinaryReader(file, **kwargs) as fin_binary:  # type: ignore
+            assert len(list(fin_binary)) == 5000
+    assert not calls
+
+
+def test_memory_mapped_line_reader(tmp_path: Path) -> None:
+    lines = [f"Line {i} \u00e4\n" for i in range(5000)] + ["No newline"]
+
+    file = tmp_path / "file.txt"
+    file.write_text("".join(lines), encoding="UTF-8")
+
+    for progress_bar in [True, False]:
+        with MemoryMappedLineReader(file, progress_bar=progress_bar) as fin:
+            result = [bytes(line) for line in fin]
+            assert result == [line.encode("UTF-8") for line in lines]
+            assert fin.tell() == fin.size()
+
+    with MemoryMappedLineReader(file) as fin:
+        assert list(fin.lines(encoding="UTF-8")) == lines
+
+    # Lines that are still referenced do not prevent closing.
+    with MemoryMappedLineReader(file) as fin:
+        first_line = next(iter(fin))
+    assert bytes(first_line) == lines[0].encode("UTF-8")
+
+    file.write_bytes(b"")
+    with MemoryMappedLineReader(file) as fin:
+        assert list(fin) == []
+
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(lines))
+    with raises(ValueError):
+        MemoryMappedLineReader(file)
+
+
+def test_decompressing_binary_reader(tmp_path: Path) -> None:
+    lines = [f"Line {i} \u00e4\n".encode("UTF-8") for i in range(5000)]
+    content = b"".join(lines)
+
+    for compression in [None, *Compression]:
+        file = tmp_path / ("file" + (compression.value if compression else ".txt"))
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fout:
+            fout.write(content.decode("UTF-8"))
+
+        for progress_bar, readahead in [(True, 0), (False, 2)]:
+            with DecompressingBinaryReader(
+                file,
+                readahead=readahead,
+                warn_uncompressed=False,
+                progress_bar=progress_bar,
+            ) as fin:
+                assert fin.tell() == 0
+                assert list(fin) == lines
+                assert fin.tell() == fin.size()
+
+        with DecompressingBinaryReader(file, warn_uncompressed=False) as fin:
+            assert fin.readline() == lines[0]
+            buffer = bytearray(10)
+            assert fin.readinto(buffer) == 10
+            assert buffer == content[len(lines[0]) :][:10]
+            blocks = list(fin.iter_blocks(1000))
+            assert all(len(block) == 1000 for block in blocks[:-1])
+            assert b"".join(blocks) == content[len(lines[0]) + 10 :]
+
+
+def test_multi_file_text_reader(tmp_path: Path) -> None:
+    contents = []
+    files = []
+    for i, compression in enumerate([None, *Compression]):
+        content = "".join(f"File {i} line {j}\n" for j in range(1000))
+        file = tmp_path / (f"file{i}" + (compression.value if compression else ".txt"))
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fout:
+            fout.write(content)
+        contents.append(content)
+        files.append(file)
+    (tmp_path / "empty.txt").write_bytes(b"")
+    files.insert(2, tmp_path / "empty.txt")
+
+    for readahead, progress_bar in [(0, True), (2, False)]:
+        with MultiFileTextReader(
+            files,
+            encoding="UTF-8",
+            readahead=readahead,
+            warn_uncompressed=False,
+            progress_bar=progress_bar,
+        ) as fin:
+            assert fin.size() == sum(file.stat().st_size for file in files)
+            assert fin.tell() == 0
+            assert "".join(fin) == "".join(contents)
+            assert fin.tell() == fin.size()
+
+    with MultiFileTextReader(
+        str(tmp_path / "file*"), encoding="UTF-8", warn_uncompressed=False
+    ) as fin:
+        assert fin.paths == sorted(file for file in files if file.name != "empty.txt")
+        assert fin.path is None and fin.checksum is None
+        assert fin.readline() == "File 0 line 0\n"
+
+    with raises(FileNotFoundError):
+        MultiFileTextReader(str(tmp_path / "missing*"), encoding="UTF-8")
+
+
+def test_decompressing_text_io_wrapper_external_decompressor(tmp_path: Path) -> None:
+    if not which("zstd"):
+        skip("zstd binary is not installed.")
+
+    content = "".join(f"Line {i}\n" for i in range(10000))
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write(content)
+
+    for decompressor in [DecompressorBackend.EXTERNAL, DecompressorBackend.AUTO]:
+        for readahead in [0, 2]:
+            with DecompressingTextIOWrapper(
+                file,
+                encoding="UTF-8",
+                decompressor=decompressor,
+                readahead=readahead,
+                progress_bar=True,
+            ) as fin:
+                assert "".join(fin) == content
+                assert fin.tell() == fin.size()
+                # zstd is not faster than zstandard, so AUTO does not use it.
+                assert isinstance(fin._fin, nasty_utils.io_._ExternalDecompressor) == (
+                    decompressor == DecompressorBackend.EXTERNAL
+                )
+
+    # Closing before having read everything terminates the process.
+    with DecompressingTextIOWrapper(
+        file, encoding="UTF-8", decompressor=DecompressorBackend.EXTERNAL
+    ) as fin:
+        assert fin.readline() == "Line 0\n"
+
+    file.write_bytes(file.read_bytes()[:-10])
+    with raises(OSError):
+        with DecompressingTextIOWrapper(
+            file, encoding="UTF-8", decompressor=DecompressorBackend.EXTERNAL
+        ) as fin:
+            fin.read()
+
+
+def test_external_decompressor_stderr(tmp_path: Path) -> None:
+    # Writing more to stderr than fits into a pipe must not block the process.
+    script = (
+        "import sys; sys.stderr.write('Warning\\n' * 100000); sys.stderr.flush(); "
+        "sys.stdout.buffer.write(sys.stdin.buffer.read()); sys.exit('Failed')"
+    )
+    file = tmp_path / "file.txt"
+    file.write_bytes(b"Line\n" * 1000)
+    with file.open("rb") as fp:
+        fin = nasty_utils.io_._ExternalDecompressor(fp, [sys.executable, "-c", script])
+        try:
+            with raises(OSError, match="Warning\n.*Failed"):
+                fin.readall()
+        finally:
+            fin.close()
+
+
+def test_zstd_dict(tmp_path: Path) -> None:
+    contents = [
+        f'{{"id": {i}, "user": "user{i % 7}", "text": "Tweet number {i}."}}\n'
+        for i in range(1000)
+    ]
+    for i, content in enumerate(contents):
+        (tmp_path / f"sample{i}.txt").write_text(content, encoding="UTF-8")
+
+    zstd_dict = train_zstd_dict(
+        tmp_path.glob("sample*.txt"), dict_size=4096, max_samples=500
+    )
+    assert zstd_dict.dict_id()
+
+    data_dir = tmp_path / "data" / "nested"
+    data_dir.mkdir(parents=True)
+    for i, content in enumerate(contents[:10]):
+        with CompressingTextIOWrapper(
+            data_dir / f"file{i}.zst", encoding="UTF-8", zstd_dict=zstd_dict
+        ) as fout:
+            fout.write(content)
+
+    with DecompressingTextIOWrapper(
+        data_dir / "file0.zst", encoding="UTF-8", zstd_dict=zstd_dict
+    ) as fin:
+        assert fin.read() == contents[0]
+
+    with raises(FileNotFoundError):
+        DecompressingTextIOWrapper(data_dir / "file0.zst", encoding="UTF-8")
+
+    # Dictionary is found in a parent directory.
+    (tmp_path / "data" / ZSTD_DICT_FILE_NAME).write_bytes(zstd_dict.as_bytes())
+    with MultiFileTextReader(
+        sorted(data_dir.glob("*.zst")),
+        encoding="UTF-8",
+        decompressor=DecompressorBackend.AUTO,
+    ) as fin:
+        assert fin.read() == "".join(contents[:10])
+
+
+def test_decompressing_text_io_wrapper_checksum(tmp_path: Path) -> None:
+    content = "".join(f"Line {i}\n" for i in range(10000))
+
+    for compression in Compression:
+        file = tmp_path / ("file" + compression.value)
+        with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+            fout.write(content)
+        expected_checksum = sha256sum(file)
+
+        for readahead in [0, 2]:
+            with DecompressingTextIOWrapper(
+                file,
+                encoding="UTF-8",
+                expected_checksum=expected_checksum,
+                readahead=readahead,
+            ) as fin:
+                if readahead:
+                    # The background thread may already have read the whole file.
+                    assert fin.checksum in (None, expected_checksum)
+                else:
+                    assert fin.checksum is None
+                assert fin.read() == content
+                assert fin.checksum == expected_checksum
+
+        with DecompressingBinaryReader(file, checksum_algorithm="md5") as fin:
+            assert list(fin)
+            assert fin.checksum is not None and len(fin.checksum) == 32
+
+        with raises(ChecksumMismatchError):
+            with DecompressingTextIOWrapper(
+                file, encoding="UTF-8", expected_checksum="0" * 64
+            ) as fin:
+                fin.read()
+
+
+def test_sharded_compressing_writer(tmp_path: Path) -> None:
+    records = [f"Record {i}" for i in range(1000)]
+
+    with ShardedCompressingWriter(
+        tmp_path / "by-records" / "shard-{index:03d}.jsonl.zst",
+        encoding="UTF-8",
+        max_records=300,
+        chunk_size=100,
+        max_pending_chunks=2,
+    ) as writer:
+        for record in records:
+            writer.write(record)
+    assert [path.name for path in writer.paths] == [
+        f"shard-{i:03d}.jsonl.zst" for i in range(4)
+    ]
+    assert sorted((tmp_path / "by-records").iterdir()) == writer.paths
+    with MultiFileTextReader(writer.paths, encoding="UTF-8") as fin:
+        assert fin.read().splitlines() == records
+
+    with ShardedCompressingWriter(
+        str(tmp_path / "by-bytes-{index}.gz"), encoding="UTF-8", max_bytes=1000
+    ) as writer:
+        for record in records:
+            writer.write(record + "\n")
+    for path in writer.paths[:-1]:
+        with DecompressingBinaryReader(path) as fin:
+            assert 1000 <= len(fin.read()) < 1000 + len(records[-1]) + 1
+
+    with ShardedCompressingWriter(
+        tmp_path / "{date:%Y-%m-%d}.xz", encoding="UTF-8"
+    ) as writer:
+        for i, record in enumerate(records):
+            writer.write(record, date=date(2020, 1, 1 + i // 100))
+    assert len(writer.paths) == 10
+    assert writer.paths[-1].name == "2020-01-10.xz"
+
+    with raises(ValueError):
+        with ShardedCompressingWriter(
+            tmp_path / "no-placeholder.zst", encoding="UTF-8", max_records=1
+        ) as writer:
+            for record in records:
+                writer.write(record)
+
+    # Shards that are incomplete when an exception is raised are discarded.
+    with raises(KeyboardInterrupt):
+        with ShardedCompressingWriter(
+            tmp_path / "interrupted" / "shard-{index}.gz",
+            encoding="UTF-8",
+            max_records=300,
+        ) as writer:
+            for record in records[:500]:
+                writer.write(record)
+            raise KeyboardInterrupt()
+    assert [path.name for path in writer.paths] == ["shard-0.gz"]
+    assert sorted(path.name for path in (tmp_path / "interrupted").iterdir()) == [
+        "shard-0.gz"
+    ]
+    with DecompressingTextIOWrapper(writer.paths[0], encoding="UTF-8") as fin:
+        assert fin.read() == "".join(record + "\n" for record in records[:300])
+
+
+def test_decompressing_text_io_wrapper_stats(
+    tmp_path: Path, caplog: LogCaptureFixture
+) -> None:
+    lines = [f"Line {i}\n" for i in range(10000)]
+    file = tmp_path / "file.gz"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(lines))
+
+    with DecompressingTextIOWrapper(file, encoding="UTF-8") as fin:
+        assert fin.stats is None
+
+    for readahead in [0, 2]:
+        with caplog.at_level(logging.INFO), DecompressingTextIOWrapper(
+            file, encoding="UTF-8", readahead=readahead, log_stats=True
+        ) as fin:
+            assert fin.readline() == lines[0]
+            assert fin.read(5) == lines[1][:5]
+            assert list(fin) == [lines[1][5:]] + lines[2:]
+        stats = fin.stats
+        assert stats is not None
+        assert stats.compressed_bytes == fin.size()
+        assert stats.decompressed_bytes == len("".join(lines))
+        assert stats.lines == len(lines)
+        assert 0 < stats.decompression_seconds <= stats.read_seconds
+        assert stats.read_seconds <= stats.elapsed_seconds
+        assert stats.decompressed_mib_per_second > stats.compressed_mib_per_second
+        assert str(stats) in caplog.text
+
+    with DecompressingBinaryReader(file, stats=True) as fin:
+        assert list(fin.iter_blocks(1000))
+    assert fin.stats is not None and fin.stats.lines == len(lines)
+
+    with DecompressingBinaryReader(file, stats=True) as fin:
+        buffer = memoryview(bytearray(1000))
+        while fin.readinto(buffer):
+            pass
+    assert fin.stats is not None and fin.stats.lines == len(lines)
+
+
+def test_count_lines(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        nasty_utils.io_, "LINE_COUNT_CACHE_FILE", tmp_path / "cache" / "counts.db"
+    )
+
+    for content, num_lines in [("", 0), ("a\nb\n", 2), ("a\nb", 2), ("\n\n\n", 3)]:
+        for compression in [None, *Compression]:
+            file = tmp_path / ("file" + (compression.value if compression else ".txt"))
+            with CompressingTextIOWrapper(
+                file, encoding="UTF-8", warn_uncompressed=False
+            ) as fout:
+                fout.write(content)
+            assert count_lines(file, cache=False) == num_lines
+            assert count_lines(file) == num_lines
+            assert count_lines(file, chunk_size=1) == num_lines  # Cached.
+
+    # Cache is used as long as the file is unchanged.
+    file = tmp_path / "file.txt"
+    file.write_text("a\n" * 1000, encoding="UTF-8")
+    os.utime(file, ns=(0, 0))
+    assert count_lines(file) == 1000
+    file.write_text("b\n" * 1000, encoding="UTF-8")
+    os.utime(file, ns=(0, 0))
+    assert count_lines(file) == 1000
+    file.write_text("a\n" * 10, encoding="UTF-8")
+    assert count_lines(file) == 10
+
+    with DecompressingTextIOWrapper(
+        file,
+        encoding="UTF-8",
+        progress_bar=True,
+        progress_bar_lines=True,
+        progress_bar_interval=0,
+    ) as fin:
+        progress_bar = fin._progress_bar
+        assert progress_bar is not None and progress_bar.total == 10
+        assert fin.readline() == "a\n"
+        assert progress_bar.n == 1
+        assert len(list(fin)) == 9
+        assert progress_bar.n == 10
+
+
+def test_decompressing_text_io_wrapper_stream(tmp_path: Path) -> None:
+    content = "".join(f"Line {i}\n" for i in range(10000))
+
+    for compression in [None, *Compression]:
+        file = tmp_path / ("file" + (compression.value if compression else ".txt"))
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fout:
+            fout.write(content)
+
+        for readahead, progress_bar in [(0, True), (2, False)]:
+            process = Popen(["cat", str(file)], stdout=PIPE)
+            with DecompressingTextIOWrapper(
+                cast(BinaryIO, process.stdout),
+                encoding="UTF-8",
+                readahead=readahead,
+                warn_uncompressed=False,
+                progress_bar=progress_bar,
+                expected_checksum=sha256sum(file),
+            ) as fin:
+                assert fin.path is None
+                assert fin.size() is None
+                assert fin.compression == compression
+                assert "".join(fin) == content
+                assert fin.tell() == file.stat().st_size
+            assert process.wait() == 0
+
+        with file.open("rb") as fp, DecompressingBinaryReader(
+            fp, warn_uncompressed=False
+        ) as fin:
+            assert fin.read() == content.encode("UTF-8")
+        assert fp.closed
+
+
+def test_decompressing_reader_open(tmp_path: Path) -> None:
+    file = tmp_path / "file.gz"
+    with gzip.open(file, "wt", encoding="UTF-8") as fout:
+        fout.write("Line 1\nLine 2\n")
+
+    with DecompressingTextIOWrapper(str(file), encoding="UTF-8") as fin:
+        assert fin.path == file
+        assert fin.read() == "Line 1\nLine 2\n"
+    with DecompressingBinaryReader(str(file)) as fin_binary:
+        assert fin_binary.path == file
+        assert fin_binary.read() == b"Line 1\nLine 2\n"
+
+    with raises(TypeError):
+        DecompressingTextIOWrapper(cast(BinaryIO, 42), encoding="UTF-8")
+
+    # Everything that was opened is closed again if opening fails.
+    num_threads = threading.active_count()
+    with file.open("rb") as fp:
+        with raises(LookupError):
+            DecompressingTextIOWrapper(
+                fp, encoding="no-such-encoding", readahead=2, progress_bar=True
+            )
+        assert fp.closed
+    with file.open("rb") as fp:
+        with raises(ValueError):
+            DecompressingBinaryReader(fp, buffer_size=0, readahead=2)
+        assert fp.closed
+    assert threading.active_count() == num_threads
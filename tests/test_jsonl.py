@@ -0,0 +1,91 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from pytest import raises
+
+from nasty_utils import (
+    CompressingTextIOWrapper,
+    JsonlReader,
+    find_json_backend,
+    json_loads_function,
+    lookup_field,
+)
+
+
+def test_json_backends() -> None:
+    assert find_json_backend("json") == "json"
+    assert json_loads_function("json")(b'{"a": 1}') == {"a": 1}
+    assert json_loads_function()(b"[1, 2]") == [1, 2]
+    with raises(ValueError):
+        find_json_backend("does-not-exist")
+
+
+def test_lookup_field() -> None:
+    record = {"id": 1, "user": {"id": 2, "lang": None}, "tags": ["a"]}
+    assert lookup_field(record, "id") == 1
+    assert lookup_field(record, "user.id") == 2
+    assert lookup_field(record, ["user", "id"]) == 2
+    assert lookup_field(record, "user") == {"id": 2, "lang": None}
+    assert lookup_field(record, "user.lang") is None
+    assert lookup_field(record, "user.name") is None
+    assert lookup_field(record, "tags.0") is None
+    assert lookup_field(record, "id.value") is None
+    assert lookup_field([record], "id") is None
+
+
+def test_jsonl_reader(tmp_path: Path) -> None:
+    records = [{"id": i, "text": f"Tweet ä {i}"} for i in range(3000)]
+
+    file = tmp_path / "file.jsonl.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        for record in records:
+            fout.write(json.dumps(record) + "\n")
+        fout.write("\n")
+
+    for json_backend in [None, "json"]:
+        with JsonlReader(file, json_backend=json_backend) as reader:
+            assert list(reader) == records
+            assert reader.num_records == len(records)
+
+    with JsonlReader(file) as reader:
+        batches = list(reader.iter_batches(1000))
+        assert [len(batch) for batch in batches] == [1000, 1000, 1000]
+
+    with ThreadPoolExecutor(2) as executor:
+        with JsonlReader(
+            file, executor=executor, parse_batch_size=7, max_pending_batches=3
+        ) as reader:
+            assert list(reader) == records
+
+    file = tmp_path / "malformed.jsonl.gz"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write('{"id": 0}\n{"id": \n{"id": 2}\nnot json\n')
+
+    with JsonlReader(file) as reader:
+        with raises(ValueError):
+            list(reader)
+
+    with ProcessPoolExecutor(2) as executor:
+        with JsonlReader(
+            file, skip_malformed=True, executor=executor, parse_batch_size=1
+        ) as reader:
+            assert list(reader) == [{"id": 0}, {"id": 2}]
+            assert reader.num_records == 2
+            assert reader.num_malformed == 2
@@ -0,0 +1,169 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+from pathlib import Path
+
+from pytest import raises
+
+from nasty_utils import (
+    ZSTD_DICT_FILE_NAME,
+    CompressingTextIOWrapper,
+    IndexedLineReader,
+    LineIndex,
+    ReadCheckpoint,
+    ResumableLineReader,
+    train_zstd_dict,
+)
+
+
+def test_line_index(tmp_path: Path) -> None:
+    lines = [f"Line {i}: {'x' * (i % 17)}\n" for i in range(1000)] + ["No newline"]
+    content = "".join(lines)
+
+    files = []
+    for name in ["file.txt", "file.bz2", "file.xz", "file.zst"]:
+        files.append(tmp_path / name)
+        with CompressingTextIOWrapper(
+            files[-1], encoding="UTF-8", frame_size=100, warn_uncompressed=False
+        ) as fout:
+            fout.write(content)
+
+    # Multi-member gzip file with members not aligned to lines.
+    files.append(tmp_path / "file.gz")
+    data = content.encode("UTF-8")
+    files[-1].write_bytes(
+        b"".join(gzip.compress(data[i : i + 333]) for i in range(0, len(data), 333))
+    )
+
+    for file in files:
+        index = LineIndex.build(file, restart_interval=250)
+        assert index.num_lines == len(lines)
+        if file.suffix in (".txt", ".gz", ".zst"):
+            assert len(index.compressed_offsets) > 1
+
+        index.save(LineIndex.sidecar_path(file))
+        assert LineIndex.load_or_build(file) == index
+
+        with IndexedLineReader(file, encoding="UTF-8") as reader:
+            assert list(reader) == lines
+            for start, stop in [(0, 1), (500, 510), (17, 18), (990, 2000), (3, 3)]:
+                assert reader.read_range(start, stop) == lines[start:stop]
+            reader.seek_line(len(lines))
+            assert reader.readline() == ""
+            with raises(ValueError):
+                reader.seek_line(len(lines) + 1)
+
+    # Outdated indices are rebuilt.
+    file = tmp_path / "file.txt"
+    file.write_text("Other content\n", encoding="UTF-8")
+    with IndexedLineReader(file, encoding="UTF-8") as reader:
+        assert reader.index.num_lines == 1
+        assert list(reader) == ["Other content\n"]
+
+
+def test_line_index_empty_file(tmp_path: Path) -> None:
+    for name in ["empty.txt", "empty.zst"]:
+        file = tmp_path / name
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", warn_uncompressed=False
+        ) as fout:
+            fout.write("")
+
+        index = LineIndex.build(file)
+        assert index.num_lines == 0
+        assert list(index.compressed_offsets) == [0]
+        with IndexedLineReader(file, encoding="UTF-8", index=index) as reader:
+            assert list(reader) == []
+            assert reader.read_range(0, 10) == []
+
+
+def test_line_index_zstd_dict(tmp_path: Path) -> None:
+    lines = [f'{{"id": {i}, "text": "Line number {i}."}}\n' for i in range(1000)]
+    for i, line in enumerate(lines):
+        (tmp_path / f"sample{i}.txt").write_text(line, encoding="UTF-8")
+    zstd_dict = train_zstd_dict(
+        tmp_path.glob("sample*.txt"), dict_size=4096, max_samples=500
+    )
+    (tmp_path / ZSTD_DICT_FILE_NAME).write_bytes(zstd_dict.as_bytes())
+
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(
+        file, encoding="UTF-8", frame_size=100, zstd_dict=zstd_dict
+    ) as fout:
+        fout.write("".join(lines))
+
+    index = LineIndex.build(file, restart_interval=250)
+    assert index.num_lines == len(lines)
+    assert len(index.compressed_offsets) > 1
+    with IndexedLineReader(file, encoding="UTF-8", index=index) as reader:
+        assert reader.read_range(500, 510) == lines[500:510]
+
+    with ResumableLineReader(file, encoding="UTF-8") as reader:
+        for _ in range(500):
+            reader.readline()
+        checkpoint = reader.checkpoint()
+    assert checkpoint.compressed_offset > 0
+    with ResumableLineReader(file, encoding="UTF-8", checkpoint=checkpoint) as reader:
+        assert list(reader) == lines[500:]
+
+
+def test_resumable_line_reader(tmp_path: Path) -> None:
+    lines = [f"Line {i}: {'x' * (i % 17)}\n" for i in range(1000)] + ["No newline"]
+    content = "".join(lines)
+
+    files = []
+    for name in ["file.txt", "file.bz2", "file.zst"]:
+        files.append(tmp_path / name)
+        with CompressingTextIOWrapper(
+            files[-1], encoding="UTF-8", frame_size=100, warn_uncompressed=False
+        ) as fout:
+            fout.write(content)
+
+    # Multi-member gzip file with members not aligned to lines.
+    files.append(tmp_path / "file.gz")
+    data = content.encode("UTF-8")
+    files[-1].write_bytes(
+        b"".join(gzip.compress(data[i : i + 333]) for i in range(0, len(data), 333))
+    )
+
+    for file in files:
+        with ResumableLineReader(file, encoding="UTF-8") as reader:
+            assert list(reader) == lines
+            assert reader.tell_line() == len(lines)
+
+        checkpoint = None
+        for stop in [0, 1, 17, 500, 999, len(lines)]:
+            with ResumableLineReader(
+                file, encoding="UTF-8", checkpoint=checkpoint
+            ) as reader:
+                while reader.tell_line() < stop:
+                    assert reader.readline() == lines[reader.tell_line() - 1]
+                token = reader.checkpoint().to_token()
+            checkpoint = ReadCheckpoint.from_token(token)
+            assert checkpoint.line == stop
+            if file.suffix in (".txt", ".gz", ".zst") and stop > 17:
+                assert checkpoint.compressed_offset > 0
+                assert checkpoint.skip_lines < 20
+
+            with ResumableLineReader(
+                file, encoding="UTF-8", checkpoint=checkpoint
+            ) as reader:
+                assert list(reader) == lines[stop:]
+
+        file.write_bytes(b"")
+        with raises(ValueError):
+            ResumableLineReader(file, encoding="UTF-8", checkpoint=checkpoint)
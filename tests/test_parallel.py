@@ -0,0 +1,184 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import struct
+from pathlib import Path
+from time import sleep
+from typing import MutableSequence, Sequence
+
+from pytest import raises
+from zstandard import ZstdCompressor
+
+from nasty_utils import (
+    ZSTD_DICT_FILE_NAME,
+    CompressingTextIOWrapper,
+    FanOutReader,
+    iter_lines_sharded,
+    map_lines_sharded,
+    parallel_map_lines,
+    train_zstd_dict,
+)
+
+
+def _line_len(line: str) -> int:
+    return len(line)
+
+
+def test_lines_sharded(tmp_path: Path) -> None:
+    lines = [f"Line {i}: {'x' * (i % 17)}\n" for i in range(1000)] + ["No newline"]
+
+    files = [tmp_path / "file.txt", tmp_path / "file.gz", tmp_path / "file.zst"]
+    for file in files:
+        with CompressingTextIOWrapper(
+            file, encoding="UTF-8", frame_size=100, warn_uncompressed=False
+        ) as fout:
+            fout.write("".join(lines))
+
+    # Seekable file with frames whose boundaries do not align with lines.
+    files.append(tmp_path / "unaligned.zst")
+    content = "".join(lines).encode("UTF-8")
+    chunks = [content[i : i + 37] for i in range(0, len(content), 37)]
+    frames = [ZstdCompressor().compress(chunk) for chunk in chunks]
+    files[-1].write_bytes(
+        b"".join(frames)
+        + struct.pack("<II", 0x184D2A5E, len(frames) * 8 + 9)
+        + b"".join(
+            struct.pack("<II", len(frame), len(chunk))
+            for frame, chunk in zip(frames, chunks)
+        )
+        + struct.pack("<IBI", len(frames), 0, 0x8F92EAB1)
+    )
+
+    for file in files:
+        for shard_size in [1, 128, 2 ** 26]:
+            assert (
+                list(
+                    iter_lines_sharded(
+                        file, encoding="UTF-8", workers=2, shard_size=shard_size
+                    )
+                )
+                == lines
+            )
+            assert (
+                sorted(
+                    map_lines_sharded(
+                        file,
+                        _line_len,
+                        encoding="UTF-8",
+                        workers=2,
+                        ordered=False,
+                        shard_size=shard_size,
+                    )
+                )
+                == sorted(len(line) for line in lines)
+            )
+
+
+def test_lines_sharded_zstd_dict(tmp_path: Path) -> None:
+    lines = [f'{{"id": {i}, "text": "Line number {i}."}}\n' for i in range(1000)]
+    for i, line in enumerate(lines):
+        (tmp_path / f"sample{i}.txt").write_text(line, encoding="UTF-8")
+    zstd_dict = train_zstd_dict(
+        tmp_path.glob("sample*.txt"), dict_size=4096, max_samples=500
+    )
+    (tmp_path / ZSTD_DICT_FILE_NAME).write_bytes(zstd_dict.as_bytes())
+
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(
+        file, encoding="UTF-8", frame_size=100, zstd_dict=zstd_dict
+    ) as fout:
+        fout.write("".join(lines))
+
+    assert (
+        list(iter_lines_sharded(file, encoding="UTF-8", workers=2, shard_size=128))
+        == lines
+    )
+
+
+def test_parallel_map_lines(tmp_path: Path) -> None:
+    lines = [f"Line {i}: {'x' * (i % 17)}\n" for i in range(1000)]
+
+    files = [tmp_path / "file.gz", tmp_path / "file.bz2", tmp_path / "file.zst"]
+    for file in files:
+        with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+            fout.write("".join(lines))
+    expected = [len(line) for line in lines] * len(files)
+
+    for chunk_lines in [1, 100, 10000]:
+        assert (
+            list(
+                parallel_map_lines(
+                    files,
+                    _line_len,
+                    encoding="UTF-8",
+                    workers=2,
+                    chunk_lines=chunk_lines,
+                    progress_bar=True,
+                )
+            )
+            == expected
+        )
+        assert (
+            sorted(
+                parallel_map_lines(
+                    files,
+                    _line_len,
+                    encoding="UTF-8",
+                    workers=2,
+                    chunk_lines=chunk_lines,
+                    ordered=False,
+                )
+            )
+            == sorted(expected)
+        )
+
+    # Stopping early stops the reader thread.
+    results = parallel_map_lines(files[0], _line_len, encoding="UTF-8", chunk_lines=1)
+    assert next(results) == len(lines[0])
+    results.close()
+
+
+def test_fan_out_reader(tmp_path: Path) -> None:
+    lines = [f"Line {i}\n" for i in range(1000)]
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+        fout.write("".join(lines))
+
+    received: Sequence[MutableSequence[str]] = ([], [], [])
+
+    def slow(batch: Sequence[str]) -> None:
+        sleep(0.001)
+        received[2].extend(batch)
+
+    reader = FanOutReader(file, encoding="UTF-8", batch_size=100, log_stats=True)
+    reader.add_callback(received[0].extend, name="callback")
+    reader.add_thread(received[1].extend, name="thread")
+    slow_stats = reader.add_thread(slow, max_pending_batches=1)
+    stats = reader.run()
+    assert all(consumer_lines == lines for consumer_lines in received)
+    assert [s.name for s in stats] == ["callback", "thread", "slow"]
+    assert all(s.lines == len(lines) and s.batches == 10 for s in stats)
+    assert slow_stats is stats[2] and slow_stats.busy_seconds > 0
+    assert reader.reader_stats is not None and reader.reader_stats.lines == len(lines)
+
+    def failing(batch: Sequence[str]) -> None:
+        raise ValueError("Consumer failed.")
+
+    reader = FanOutReader(file, encoding="UTF-8", batch_size=100)
+    reader.add_thread(received[0].extend)
+    reader.add_thread(failing)
+    with raises(ValueError):
+        reader.run()
@@ -0,0 +1,86 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+from pathlib import Path
+
+from nasty_utils import (
+    CompressingTextIOWrapper,
+    Compression,
+    DecompressingTextIOWrapper,
+    RecompressProgram,
+    read_seek_table,
+    recompressed_path,
+)
+
+
+def test_recompress_program(tmp_path: Path) -> None:
+    content = "".join(f"Line {i}\n" for i in range(10000))
+
+    source = tmp_path / "source"
+    files = [
+        source / "a.jsonl.gz",
+        source / "nested" / "b.jsonl.bz2",
+        source / "nested" / "deeper" / "c.xz",
+    ]
+    for file in files:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with CompressingTextIOWrapper(file, encoding="UTF-8") as fout:
+            fout.write(content)
+        os.utime(file, ns=(0, 1234567890))
+    (source / "ignored.txt").write_text(content, encoding="UTF-8")
+    (source / "ignored.zst").write_bytes(b"")
+
+    assert recompressed_path(files[0]).name == "a.jsonl.zst"
+
+    destination = tmp_path / "destination"
+    RecompressProgram.init(
+        "--source",
+        str(source),
+        "--destination",
+        str(destination),
+        "--frame-size",
+        "10000",
+        "-j",
+        "2",
+    ).run()
+
+    recompressed = sorted(path for path in destination.rglob("*") if path.is_file())
+    assert recompressed == sorted(
+        destination / recompressed_path(file).relative_to(source) for file in files
+    )
+    for file in recompressed:
+        assert file.stat().st_mtime_ns == 1234567890
+        frames = read_seek_table(file)
+        assert frames is not None and len(frames) > 1
+        with DecompressingTextIOWrapper(file, encoding="UTF-8") as fin:
+            assert fin.compression == Compression.ZSTD
+            assert fin.read() == content
+
+    # Already recompressed files are skipped.
+    (destination / "a.jsonl.zst").write_bytes(b"")
+    os.utime(destination / "a.jsonl.zst", ns=(0, 1234567890))
+    RecompressProgram.init("--source", str(source), "-d", str(destination)).run()
+    assert (destination / "a.jsonl.zst").read_bytes() == b""
+
+    RecompressProgram.init("--source", str(source), "--delete").run()
+    assert sorted(path.name for path in source.rglob("*.zst")) == [
+        "a.jsonl.zst",
+        "b.jsonl.zst",
+        "c.zst",
+        "ignored.zst",
+    ]
+    assert not any(file.exists() for file in files)
@@ -0,0 +1,50 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from pathlib import Path
+
+from zstandard import ZstdCompressor
+
+from nasty_utils import (
+    CompressingTextIOWrapper,
+    DecompressingTextIOWrapper,
+    read_seek_table,
+)
+
+
+def test_seekable_zstd(tmp_path: Path) -> None:
+    lines = [f"Line {i}: {'x' * (i % 17)}\n" for i in range(1000)]
+    content = "".join(lines)
+
+    file = tmp_path / "file.zst"
+    with CompressingTextIOWrapper(file, encoding="UTF-8", frame_size=1000) as fout:
+        fout.write(content)
+
+    frames = read_seek_table(file)
+    assert frames is not None and len(frames) > 1
+    assert sum(frame.decompressed_size for frame in frames) == len(content)
+
+    with file.open("rb") as fin:
+        for frame in frames:
+            data = frame.decompress(fin).decode("UTF-8")
+            assert data.endswith("\n")
+            assert data == content[frame.decompressed_offset :][: len(data)]
+
+    with DecompressingTextIOWrapper(file, encoding="UTF-8") as fin:
+        assert fin.read() == content
+
+    file.write_bytes(ZstdCompressor().compress(content.encode("UTF-8")))
+    assert read_seek_table(file) is None
@@ -0,0 +1,73 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from pathlib import Path
+from random import Random
+
+from nasty_utils import CompressingTextIOWrapper, DecompressingTextIOWrapper, sort_lines
+
+
+def _key(line: str) -> int:
+    return json.loads(line)["id"]  # type: ignore
+
+
+def test_sort_lines(tmp_path: Path) -> None:
+    random = Random(0)
+    records = [{"id": random.randrange(500), "n": i} for i in range(2000)]
+    lines = [json.dumps(record) + "\n" for record in records]
+
+    sources = [tmp_path / "a.jsonl.zst", tmp_path / "b.jsonl.gz"]
+    for source, part in zip(sources, [lines[:1200], lines[1200:]]):
+        with CompressingTextIOWrapper(source, encoding="UTF-8") as fout:
+            fout.write("".join(part).rstrip("\n"))
+
+    expected = sorted(lines, key=_key)
+    expected_unique = [
+        line
+        for i, line in enumerate(expected)
+        if i == 0 or _key(expected[i - 1]) != _key(line)
+    ]
+    destination = tmp_path / "sorted.jsonl.zst"
+    for kwargs in [
+        {},
+        {"max_memory": 10000},
+        {"max_memory": 10000, "fan_in": 3},
+        {"max_memory": 10000, "workers": 2},
+    ]:
+        for unique in [False, True]:
+            num_lines = sort_lines(
+                sources,
+                destination,
+                encoding="UTF-8",
+                key=_key,
+                unique=unique,
+                tmp_dir=tmp_path,
+                **kwargs,  # type: ignore
+            )
+            with DecompressingTextIOWrapper(destination, encoding="UTF-8") as fin:
+                assert list(fin) == (expected_unique if unique else expected)
+            assert num_lines == len(expected_unique if unique else expected)
+
+    # Without key, whole lines are compared.
+    sort_lines(sources, destination, encoding="UTF-8", unique=True, max_memory=5000)
+    with DecompressingTextIOWrapper(destination, encoding="UTF-8") as fin:
+        assert list(fin) == sorted(set(lines))
+    assert {file.name for file in tmp_path.iterdir()} == {
+        "a.jsonl.zst",
+        "b.jsonl.gz",
+        "sorted.jsonl.zst",
+    }
@@ -3,12 +3,18 @@ _.reuse_existing_virtualenvs  # unused attribute (noxfile.py:21)
 _.stop_on_first_error  # unused attribute (noxfile.py:22)
 test  # unused function (noxfile.py:25)
 _._format_action_invocation  # unused method (src/nasty_utils/_util/argparse_.py:24)
-TqdmAwareStreamHandler  # unused class (src/nasty_utils/logging_.py:254)
-_.log_level  # unused attribute (src/nasty_utils/logging_settings.py:121)
-_.log_format  # unused attribute (src/nasty_utils/logging_settings.py:122)
-_.log_date_format  # unused attribute (src/nasty_utils/logging_settings.py:123)
-_.log_cli_level  # unused attribute (src/nasty_utils/logging_settings.py:131)
+_.readable  # unused method (src/nasty_utils/io_.py:210)
+_.readable  # unused method (src/nasty_utils/io_.py:352)
+_.readable  # unused method (src/nasty_utils/io_.py:413)
+_.readable  # unused method (src/nasty_utils/io_.py:475)
+_.readable  # unused method (src/nasty_utils/io_.py:548)
+_.readable  # unused method (src/nasty_utils/io_.py:697)
+_.log_level  # unused attribute (src/nasty_utils/logging_settings.py:134)
+_.log_format  # unused attribute (src/nasty_utils/logging_settings.py:135)
+_.log_date_format  # unused attribute (src/nasty_utils/logging_settings.py:136)
+_.log_cli_level  # unused attribute (src/nasty_utils/logging_settings.py:144)
 validate_all  # unused variable (src/nasty_utils/program.py:132)
+_.writable  # unused method (src/nasty_utils/seekable_zstd.py:143)
 validate_all  # unused variable (src/nasty_utils/settings.py:43)
 allow_mutation  # unused variable (src/nasty_utils/settings.py:45)
 change_dir  # unused function (tests/_util/path.py:23)